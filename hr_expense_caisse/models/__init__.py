@@ -1,6 +1,8 @@
 from . import hr_expense_account
 from . import hr_expense_account_move
 from . import hr_expense_account_month
+from . import hr_expense_upload
+from . import ir_attachment
 # from . import account_journal
 from . import hr_employee
 from . import project_project
@@ -1,5 +1,7 @@
 from odoo import fields, models, api, _
 from odoo.exceptions import ValidationError,UserError
+from psycopg2 import IntegrityError, OperationalError
+from psycopg2.errors import UniqueViolation
 from datetime import timedelta,datetime
 from dateutil.relativedelta import relativedelta
 import logging
@@ -123,10 +125,33 @@ class HrExpenseAccountMove(models.Model):
     )
 
   
-    nbr_attachment_ids=fields.Integer("PJ",compute="get_nbr_attachment_ids")
+    # Clé générée par l'application mobile: une soumission rejouée (hors
+    # ligne, timeout) ne crée pas de doublon
+    idempotency_key = fields.Char("Clé d'idempotence", copy=False, readonly=True)
+
+    _sql_constraints = [
+        ('unique_idempotency_key', 'UNIQUE(idempotency_key)', "Ce mouvement a déjà été soumis (clé d'idempotence)."),
+    ]
+
+    # Stocké: les listes mobiles l'affichent sans lire les pièces jointes.
+    # Recalculé par ir.attachment à chaque ajout/suppression.
+    nbr_attachment_ids=fields.Integer("PJ",compute="get_nbr_attachment_ids",store=True)
     def get_nbr_attachment_ids(self):
+        counts = dict(self.env['ir.attachment'].sudo()._read_group(
+            [('res_model', '=', self._name), ('res_id', 'in', self.ids)],
+            ['res_id'], ['__count'],
+        )) if self.ids else {}
         for rec in self:
-            rec.nbr_attachment_ids=len(rec.attachment_ids.ids)
+            rec.nbr_attachment_ids = counts.get(rec.id, 0)
+
+    def _find_receipt(self, checksum):
+        """Pièce jointe de ce mouvement ayant cette empreinte SHA1"""
+        self.ensure_one()
+        return self.env['ir.attachment'].search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('checksum', '=', checksum),
+        ], limit=1)
 
     @api.model
     def create(self, values):
@@ -181,11 +206,83 @@ class HrExpenseAccountMove(models.Model):
         res = super().create(values)
 
         # Appeler Settlement après la création (pour éviter le décalage)
-        if res.date and res.expense_account_id:
+        # skip_settlement: la soumission groupée règle une seule fois par caisse
+        if res.date and res.expense_account_id and not self.env.context.get('skip_settlement'):
             res.Settlement_of_monthly_accounts(res.date, res.expense_account_id.id)
 
         return res
 
+    @api.model
+    def submit_mobile_expenses(self, items):
+        """
+        Soumission groupée depuis la file hors ligne de l'application mobile.
+        items: [{'idempotency_key': str, 'vals': {...}}], dans l'ordre de saisie.
+        Une clé déjà connue n'est pas recréée; chaque mouvement est créé dans
+        son propre savepoint, puis le règlement mensuel est lancé une seule
+        fois par caisse, à partir de la date la plus ancienne du lot.
+        Retourne un résultat par élément:
+        {'idempotency_key', 'status': 'created' | 'duplicate' | 'retry' | 'error', 'id', 'name', 'error'}
+        'retry': la même clé a été soumise en parallèle par une autre requête;
+        le client renvoie l'élément plus tard et reçoit alors 'duplicate'.
+        """
+        keys = [item.get('idempotency_key') for item in items if item.get('idempotency_key')]
+        existing = {
+            move.idempotency_key: move
+            for move in self.search([('idempotency_key', 'in', keys)])
+        }
+
+        results = []
+        settlement_dates = {}
+        Move = self.with_context(skip_settlement=True)
+        for item in items:
+            key = item.get('idempotency_key')
+            if not key:
+                results.append({'idempotency_key': key, 'status': 'error', 'error': _("Clé d'idempotence manquante.")})
+                continue
+            if key in existing:
+                move = existing[key]
+                results.append({'idempotency_key': key, 'status': 'duplicate', 'id': move.id, 'name': move.name})
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    move = Move.create(dict(item.get('vals') or {}, idempotency_key=key))
+            except IntegrityError as e:
+                self.env.invalidate_all()
+                if isinstance(e, UniqueViolation) and e.diag.constraint_name == 'hr_expense_account_move_unique_idempotency_key':
+                    # Soumission concurrente de la même clé: la ligne validée par
+                    # l'autre transaction n'est pas visible dans notre instantané
+                    # (REPEATABLE READ), seul un nouvel appel peut la relire
+                    results.append({
+                        'idempotency_key': key,
+                        'status': 'retry',
+                        'error': _("Soumission concurrente de la même clé, réessayer."),
+                    })
+                else:
+                    # Champ obligatoire manquant, tâche ou caisse supprimée...:
+                    # l'élément n'aboutira jamais tel quel
+                    results.append({'idempotency_key': key, 'status': 'error', 'error': str(e)})
+                continue
+            except OperationalError:
+                # Conflit de concurrence: toute la requête est rejouée
+                raise
+            except Exception as e:
+                # UserError, ValidationError, champ inconnu dans vals...:
+                # seul cet élément est refusé
+                self.env.invalidate_all()
+                results.append({'idempotency_key': key, 'status': 'error', 'error': str(e)})
+                continue
+
+            existing[key] = move
+            results.append({'idempotency_key': key, 'status': 'created', 'id': move.id, 'name': move.name})
+            if move.date and move.expense_account_id:
+                caisse_id = move.expense_account_id.id
+                if caisse_id not in settlement_dates or move.date < settlement_dates[caisse_id]:
+                    settlement_dates[caisse_id] = move.date
+
+        for caisse_id, date in settlement_dates.items():
+            self.Settlement_of_monthly_accounts(date, caisse_id)
+        return results
+
     # @api.constrains("total_amount")
     # def _check_expense_amount(self):
     #     for rec in self:
@@ -0,0 +1,145 @@
+from odoo import fields, models, api, _
+from odoo.exceptions import AccessError, UserError
+from datetime import timedelta
+import base64
+import hashlib
+import logging
+_logger = logging.getLogger(__name__)
+
+# Taille maximale d'un morceau envoyé par l'application mobile
+MAX_CHUNK_SIZE = 512 * 1024
+# Les envois non terminés sont purgés après ce délai
+STALE_UPLOAD_DAYS = 7
+
+
+class HrExpenseUpload(models.Model):
+    """
+    Envoi reprenable d'un justificatif de dépense, morceau par morceau.
+    start_upload -> upload_chunk (dans n'importe quel ordre, rejouable) -> finish_upload
+    """
+    _name = "hr.expense.upload"
+    _description = "Expense Receipt Upload"
+
+    move_id = fields.Many2one("hr.expense.account.move", string="Dépense", required=True, index=True, ondelete="cascade")
+    filename = fields.Char("Nom du fichier", required=True)
+    mimetype = fields.Char("Type MIME")
+    size = fields.Integer("Taille (octets)", required=True)
+    checksum = fields.Char("Empreinte SHA1", required=True, index=True)
+    chunk_ids = fields.One2many("hr.expense.upload.chunk", "upload_id", string="Morceaux")
+
+    def _check_owner(self):
+        """Seul l'utilisateur qui a ouvert l'envoi peut le compléter"""
+        if self.create_uid != self.env.user:
+            raise AccessError(_("Cet envoi appartient à un autre utilisateur."))
+
+    def _get_received(self):
+        return sorted(self.chunk_ids.mapped('index'))
+
+    @api.model
+    def start_upload(self, move_id, filename, size, checksum, mimetype=None):
+        """
+        Ouvre (ou reprend) l'envoi d'un justificatif.
+        Si la dépense a déjà une pièce jointe de même empreinte, rien n'est
+        envoyé: {'duplicate': True, 'attachment_id'}.
+        Sinon {'duplicate': False, 'upload_id', 'received', 'chunk_size'}:
+        received liste les morceaux déjà reçus d'un envoi interrompu.
+        """
+        move = self.env["hr.expense.account.move"].browse(move_id)
+        move.check_access('write')
+        attachment = move._find_receipt(checksum)
+        if attachment:
+            return {'duplicate': True, 'attachment_id': attachment.id}
+
+        upload = self.search([
+            ('move_id', '=', move.id),
+            ('checksum', '=', checksum),
+            ('create_uid', '=', self.env.uid),
+        ], limit=1)
+        if not upload:
+            upload = self.create({
+                'move_id': move.id,
+                'filename': filename,
+                'mimetype': mimetype,
+                'size': size,
+                'checksum': checksum,
+            })
+        return {
+            'duplicate': False,
+            'upload_id': upload.id,
+            'received': upload._get_received(),
+            'chunk_size': MAX_CHUNK_SIZE,
+        }
+
+    def upload_chunk(self, index, data):
+        """
+        Enregistre le morceau index (base64 via RPC, octets bruts via la
+        passerelle HTTP). Renvoyer un morceau déjà reçu le remplace.
+        """
+        self.ensure_one()
+        self._check_owner()
+        self.move_id.check_access('write')
+        raw = data if isinstance(data, bytes) else base64.b64decode(data)
+        if len(raw) > MAX_CHUNK_SIZE:
+            raise UserError(_("Un morceau ne peut pas dépasser %s octets.") % MAX_CHUNK_SIZE)
+        self.chunk_ids.filtered(lambda chunk: chunk.index == index).unlink()
+        self.env["hr.expense.upload.chunk"].create({
+            'upload_id': self.id,
+            'index': index,
+            'data': base64.b64encode(raw),
+        })
+        return {'upload_id': self.id, 'received': self._get_received()}
+
+    def finish_upload(self):
+        """
+        Assemble les morceaux, vérifie taille et empreinte, puis attache le
+        fichier à la dépense. La miniature est générée en tâche de fond.
+        Le filestore Odoo étant adressé par contenu, un même fichier attaché
+        à plusieurs dépenses n'est stocké qu'une fois.
+        """
+        self.ensure_one()
+        self._check_owner()
+        self.move_id.check_access('write')
+        chunks = self.chunk_ids.sorted('index')
+        if chunks.mapped('index') != list(range(len(chunks))):
+            raise UserError(_("Envoi incomplet: morceaux manquants."))
+        raw = b''.join(base64.b64decode(chunk.data) for chunk in chunks)
+        if len(raw) != self.size or hashlib.sha1(raw).hexdigest() != self.checksum:
+            raise UserError(_("Envoi corrompu: taille ou empreinte invalide."))
+
+        move = self.move_id
+        attachment = move._find_receipt(self.checksum)
+        duplicate = bool(attachment)
+        if not attachment:
+            attachment = self.env["ir.attachment"].create({
+                'name': self.filename,
+                'raw': raw,
+                'mimetype': self.mimetype or False,
+                'res_model': move._name,
+                'res_id': move.id,
+                'receipt_thumbnail_pending': (self.mimetype or '').startswith('image/'),
+            })
+            if attachment.receipt_thumbnail_pending:
+                self.env.ref('hr_expense_caisse.ir_cron_receipt_thumbnails')._trigger()
+        self.unlink()
+        return {'duplicate': duplicate, 'attachment_id': attachment.id}
+
+    @api.model
+    def _cron_purge_stale_uploads(self):
+        """Supprime les envois abandonnés"""
+        limit_date = fields.Datetime.now() - timedelta(days=STALE_UPLOAD_DAYS)
+        self.search([('write_date', '<', limit_date)]).unlink()
+        return True
+
+
+class HrExpenseUploadChunk(models.Model):
+    _name = "hr.expense.upload.chunk"
+    _description = "Expense Receipt Upload Chunk"
+    _order = "upload_id, index"
+
+    upload_id = fields.Many2one("hr.expense.upload", required=True, index=True, ondelete="cascade")
+    index = fields.Integer("Index", required=True)
+    data = fields.Binary("Données", attachment=False, required=True)
+
+    _sql_constraints = [
+        ('unique_upload_index', 'UNIQUE(upload_id, index)', "Ce morceau a déjà été reçu."),
+    ]
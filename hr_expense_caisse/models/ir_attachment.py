@@ -0,0 +1,62 @@
+from odoo import fields, models, api
+from odoo.tools.image import image_process
+import base64
+import logging
+_logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_BATCH = 50
+
+
+class IrAttachment(models.Model):
+    _inherit = "ir.attachment"
+
+    receipt_thumbnail = fields.Binary("Miniature", attachment=False)
+    receipt_thumbnail_pending = fields.Boolean("Miniature à générer", index=True)
+
+    def _get_expense_moves(self):
+        """Dépenses auxquelles ces pièces jointes sont attachées"""
+        move_ids = {
+            attachment.res_id for attachment in self.sudo()
+            if attachment.res_model == "hr.expense.account.move" and attachment.res_id
+        }
+        return self.env["hr.expense.account.move"].browse(move_ids)
+
+    def _recompute_expense_attachment_count(self, moves):
+        if moves:
+            self.env.add_to_compute(moves._fields['nbr_attachment_ids'], moves.exists())
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        attachments = super(IrAttachment, self).create(vals_list)
+        self._recompute_expense_attachment_count(attachments._get_expense_moves())
+        return attachments
+
+    def write(self, vals):
+        moves = self._get_expense_moves() if {'res_model', 'res_id'} & set(vals) else None
+        res = super(IrAttachment, self).write(vals)
+        if moves is not None:
+            self._recompute_expense_attachment_count(moves | self._get_expense_moves())
+        return res
+
+    def unlink(self):
+        moves = self._get_expense_moves()
+        res = super(IrAttachment, self).unlink()
+        self._recompute_expense_attachment_count(moves)
+        return res
+
+    @api.model
+    def _cron_generate_receipt_thumbnails(self):
+        """Génère les miniatures JPEG des justificatifs envoyés, par lots"""
+        attachments = self.sudo().search([('receipt_thumbnail_pending', '=', True)], limit=THUMBNAIL_BATCH)
+        for attachment in attachments:
+            values = {'receipt_thumbnail_pending': False}
+            try:
+                thumbnail = image_process(attachment.raw, size=THUMBNAIL_SIZE, quality=75, output_format='JPEG')
+                values['receipt_thumbnail'] = base64.b64encode(thumbnail)
+            except Exception as e:
+                _logger.warning("Miniature impossible pour la pièce jointe %s: %s", attachment.id, e)
+            attachment.write(values)
+        if len(attachments) == THUMBNAIL_BATCH:
+            self.env.ref('hr_expense_caisse.ir_cron_receipt_thumbnails')._trigger()
+        return True
@@ -9,7 +9,11 @@
     'website': 'https://www.yourcompany.com',
     'category': 'Uncategorized',
     'depends': ['project', 'hr_timesheet','hr_expense_caisse'],
-    'data': [],
+    'data': [
+        'security/ir.model.access.csv',
+        'data/cron.xml',
+        'views/ws_stats_views.xml',
+    ],
     'installable': True,
     'application': False,
 }
@@ -0,0 +1 @@
+from . import mobile_gateway
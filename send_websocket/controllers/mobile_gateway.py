@@ -0,0 +1,336 @@
+from odoo import http, api, SUPERUSER_ID
+from odoo.api import call_kw
+from odoo.exceptions import AccessDenied
+from odoo.http import request
+from odoo.modules.registry import Registry
+from odoo.service.model import check_method_name
+from odoo.tools.json import json_default
+from contextlib import contextmanager
+from datetime import datetime
+import gzip
+import hashlib
+import json
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Nombre maximal d'opérations dans un lot /odoo-rpc/batch
+MAX_BATCH_OPERATIONS = 50
+
+# Corps de réponse compressés (gzip) au-delà de ce nombre d'octets
+GZIP_THRESHOLD = 1024
+
+# Lectures pouvant répondre 304: leur version dépend seulement du
+# max(write_date), du nombre et des ids des enregistrements lus, à condition
+# de ne lire que des champs stockés simples (voir _is_etag_safe)
+ETAG_METHODS = ('search_read', 'read', 'search_count')
+
+
+class BatchAborted(Exception):
+    """Interrompt un lot atomique: toute la transaction est annulée"""
+
+
+class MobileGateway(http.Controller):
+    """
+    Passerelle de l'application mobile authentifiée par jeton.
+
+    POST /odoo-rpc/token          {db, username, password, device_name} -> {token, expiration_date}
+    POST /odoo-rpc/token/revoke   Authorization: Bearer <jeton>
+    POST /odoo-rpc/api            Authorization: Bearer <jeton>, {db, model, method, args, kwargs}
+    POST /odoo-rpc/batch          Authorization: Bearer <jeton>, {db, atomic, operations: [{model, method, args, kwargs}]}
+    POST /odoo-rpc/sync           Authorization: Bearer <jeton>, {db, cursors, limit}
+    POST /odoo-rpc/upload/<upload_id>/<index>   Authorization: Bearer <jeton>, X-Odoo-Database, octets bruts
+
+    Le mot de passe n'est vérifié qu'à l'échange du jeton; les appels
+    suivants ne coûtent qu'une recherche indexée sur l'empreinte du jeton.
+    Les réponses gardent le format de /odoo-rpc:
+    {success, result, operation_info, timestamp}, compressées en gzip
+    au-delà de GZIP_THRESHOLD octets. Les lectures (ETAG_METHODS) de champs
+    stockés simples portent un ETag et répondent 304 à un If-None-Match inchangé.
+    """
+
+    # ==================== OUTILS ====================
+
+    def _read_body(self):
+        """Corps JSON de la requête; ValueError s'il n'est pas un objet JSON"""
+        data = request.httprequest.get_data()
+        body = json.loads(data) if data else {}
+        if not isinstance(body, dict):
+            raise ValueError("Le corps de la requête doit être un objet JSON")
+        return body
+
+    def _bad_request(self, operation_info, error):
+        return self._response(operation_info=operation_info, success=False, error=str(error), status=400)
+
+    def _get_db(self, body):
+        return body.get('db') or request.httprequest.headers.get('X-Odoo-Database') or request.db
+
+    def _get_bearer_token(self):
+        header = request.httprequest.headers.get('Authorization') or ''
+        if header.lower().startswith('bearer '):
+            return header[7:].strip()
+        return None
+
+    def _response(self, result=None, operation_info=None, success=True, error=None, status=200, etag=None):
+        payload = {
+            'success': success,
+            'operation_info': operation_info or {},
+            'timestamp': datetime.now().isoformat(),
+        }
+        if success or result is not None:
+            payload['result'] = result
+        if error:
+            payload['error'] = error
+
+        body = json.dumps(payload, ensure_ascii=False, default=json_default).encode('utf-8')
+        headers = [('Content-Type', 'application/json; charset=utf-8')]
+        if etag:
+            headers.append(('ETag', etag))
+        accept_encoding = request.httprequest.headers.get('Accept-Encoding') or ''
+        if len(body) > GZIP_THRESHOLD and 'gzip' in accept_encoding:
+            body = gzip.compress(body)
+            headers += [('Content-Encoding', 'gzip'), ('Vary', 'Accept-Encoding')]
+        headers.append(('Content-Length', str(len(body))))
+        return request.make_response(body, headers=headers, status=status)
+
+    @contextmanager
+    def _token_env(self, db):
+        """
+        Ouvre un curseur sur db et retourne l'environnement de l'utilisateur du
+        jeton Bearer. Commit à la sortie, rollback en cas d'exception.
+        """
+        token = self._get_bearer_token()
+        if not db or not token:
+            raise AccessDenied()
+        registry = Registry(db)
+        with registry.cursor() as cr:
+            uid = api.Environment(cr, SUPERUSER_ID, {})['mobile.api.token']._authenticate(token)
+            if not uid:
+                raise AccessDenied()
+            env = api.Environment(cr, uid, {})
+            yield env(context=env['res.users'].context_get())
+
+    def _is_etag_safe(self, model, field_names):
+        """
+        Vrai si les champs lus ne dépendent que des colonnes de model:
+        champs stockés, non relationnels, ni calculés ni related. Un
+        one2many, un display_name ou un calcul peut changer sans toucher
+        au write_date de l'enregistrement lu.
+        """
+        if not field_names:
+            return False
+        for name in field_names:
+            field = model._fields.get(name)
+            if (field is None or not field.store or field.relational
+                    or field.compute or field.related):
+                if name != 'id':
+                    return False
+        return True
+
+    def _compute_etag(self, env, model, method, args=None, kwargs=None):
+        """
+        Version d'une lecture: empreinte de la requête, de l'utilisateur, du
+        max(write_date), du nombre et de la somme des ids des enregistrements
+        concernés, obtenus par une seule requête agrégée. None si la méthode
+        n'est pas une lecture, ou si les champs lus ne sont pas couverts par
+        write_date (voir _is_etag_safe): la réponse n'est alors jamais 304.
+        """
+        if method not in ETAG_METHODS:
+            return None
+        args, kwargs = args or [], kwargs or {}
+        records = env[model]
+        if method == 'read':
+            ids = args[0] if args else kwargs.get('ids') or []
+            domain = [('id', 'in', ids if isinstance(ids, list) else [ids])]
+        else:
+            domain = kwargs.get('domain', args[0] if args else [])
+        # read(ids, fields) et search_read(domain, fields, ...)
+        field_names = kwargs.get('fields', args[1] if len(args) > 1 else None)
+        if method != 'search_count' and not self._is_etag_safe(records, field_names):
+            return None
+        [(last_write, count, id_sum)] = records._read_group(domain, [], ['write_date:max', '__count', 'id:sum'])
+        key = json.dumps([env.uid, env.lang, model, method, args, kwargs, last_write, count, id_sum],
+                         sort_keys=True, default=json_default)
+        return '"%s"' % hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _call(self, env, model, method, args=None, kwargs=None):
+        """Exécute model.method(*args, **kwargs) comme un appel RPC public"""
+        check_method_name(method)
+        return call_kw(env[model], method, args or [], kwargs or {})
+
+    # ==================== JETONS ====================
+
+    @http.route('/odoo-rpc/token', type='http', auth='none', methods=['POST'], csrf=False)
+    def issue_token(self, **kw):
+        operation_info = {'operation': 'token'}
+        try:
+            body = self._read_body()
+        except ValueError as e:
+            return self._bad_request(operation_info, e)
+        db = self._get_db(body)
+        try:
+            registry = Registry(db)
+            credential = {'login': body.get('username'), 'password': body.get('password'), 'type': 'password'}
+            auth_info = registry['res.users'].authenticate(db, credential, {'interactive': False})
+            with registry.cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                token, record = env['mobile.api.token']._generate(auth_info['uid'], body.get('device_name'))
+                result = {
+                    'token': token,
+                    'uid': auth_info['uid'],
+                    'expiration_date': record.expiration_date.isoformat(),
+                }
+            return self._response(result, operation_info)
+        except AccessDenied:
+            return self._response(operation_info=operation_info, success=False,
+                                  error="Identifiants invalides", status=401)
+        except Exception as e:
+            _logger.error(f"❌ Passerelle mobile: échec de l'émission du jeton: {str(e)}", exc_info=True)
+            return self._response(operation_info=operation_info, success=False, error=str(e))
+
+    @http.route('/odoo-rpc/token/revoke', type='http', auth='none', methods=['POST'], csrf=False)
+    def revoke_token(self, **kw):
+        operation_info = {'operation': 'revoke'}
+        try:
+            body = self._read_body()
+        except ValueError as e:
+            return self._bad_request(operation_info, e)
+        try:
+            with self._token_env(self._get_db(body)) as env:
+                env['mobile.api.token']._find(self._get_bearer_token()).with_env(env).action_revoke()
+            return self._response(True, operation_info)
+        except AccessDenied:
+            return self._response(operation_info=operation_info, success=False,
+                                  error="Jeton invalide ou expiré", status=401)
+        except Exception as e:
+            _logger.warning(f"Passerelle mobile: échec de la révocation du jeton: {str(e)}")
+            return self._response(operation_info=operation_info, success=False, error=str(e))
+
+    # ==================== RPC ====================
+
+    @http.route('/odoo-rpc/api', type='http', auth='none', methods=['POST'], csrf=False)
+    def token_rpc(self, **kw):
+        try:
+            body = self._read_body()
+        except ValueError as e:
+            return self._bad_request({'operation': 'rpc'}, e)
+        model, method = body.get('model'), body.get('method')
+        operation_info = {'operation': 'rpc', 'model': model, 'method': method}
+        start = time.perf_counter()
+        try:
+            with self._token_env(self._get_db(body)) as env:
+                etag = self._compute_etag(env, model, method, body.get('args'), body.get('kwargs'))
+                if etag and etag == request.httprequest.headers.get('If-None-Match'):
+                    # ✅ Données inchangées: ni lecture ni sérialisation
+                    return request.make_response('', headers=[('ETag', etag)], status=304)
+                result = self._call(env, model, method, body.get('args'), body.get('kwargs'))
+            operation_info['duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            return self._response(result, operation_info, etag=etag)
+        except AccessDenied:
+            return self._response(operation_info=operation_info, success=False,
+                                  error="Jeton invalide ou expiré", status=401)
+        except Exception as e:
+            _logger.warning(f"Passerelle mobile: {model}.{method} a échoué: {str(e)}")
+            return self._response(operation_info=operation_info, success=False, error=str(e))
+
+    @http.route('/odoo-rpc/batch', type='http', auth='none', methods=['POST'], csrf=False)
+    def batch_rpc(self, **kw):
+        """
+        Exécute une liste ordonnée d'opérations dans une seule transaction.
+        atomic=True: la première erreur annule tout le lot, les opérations
+        suivantes ne sont pas exécutées. Sinon chaque opération a son propre
+        savepoint: une opération en échec est annulée seule.
+        result: [{index, success, result | error | skipped}] dans l'ordre.
+        """
+        operation_info = {'operation': 'batch'}
+        try:
+            body = self._read_body()
+        except ValueError as e:
+            return self._bad_request(operation_info, e)
+        operations = body.get('operations') or []
+        atomic = bool(body.get('atomic'))
+        operation_info['atomic'] = atomic
+        if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+            return self._bad_request(operation_info, "operations doit être une liste d'objets {model, method, args, kwargs}")
+        operation_info['count'] = len(operations)
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return self._bad_request(operation_info, f"Un lot contient au plus {MAX_BATCH_OPERATIONS} opérations")
+
+        start = time.perf_counter()
+        results = []
+        try:
+            with self._token_env(self._get_db(body)) as env:
+                for index, operation in enumerate(operations):
+                    try:
+                        with env.cr.savepoint():
+                            result = self._call(env, operation.get('model'), operation.get('method'),
+                                                operation.get('args'), operation.get('kwargs'))
+                        results.append({'index': index, 'success': True, 'result': result})
+                    except Exception as e:
+                        env.invalidate_all()
+                        results.append({'index': index, 'success': False, 'error': str(e)})
+                        if atomic:
+                            raise BatchAborted()
+        except AccessDenied:
+            return self._response(operation_info=operation_info, success=False,
+                                  error="Jeton invalide ou expiré", status=401)
+        except BatchAborted:
+            results += [{'index': index, 'success': False, 'skipped': True}
+                        for index in range(len(results), len(operations))]
+            operation_info['duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            return self._response(results, operation_info, success=False,
+                                  error="Lot annulé: une opération a échoué")
+        except Exception as e:
+            # Base inconnue, échec du commit (conflit de sérialisation)...:
+            # rien n'a été validé
+            _logger.warning(f"Passerelle mobile: échec du lot: {str(e)}")
+            return self._response(operation_info=operation_info, success=False, error=str(e))
+
+        operation_info['duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return self._response(results, operation_info, success=all(item['success'] for item in results))
+
+    # ==================== SYNCHRONISATION ====================
+
+    @http.route('/odoo-rpc/sync', type='http', auth='none', methods=['POST'], csrf=False)
+    def sync_changes(self, **kw):
+        """Modifications et suppressions depuis les curseurs du client (voir mobile.sync)"""
+        operation_info = {'operation': 'sync'}
+        try:
+            body = self._read_body()
+        except ValueError as e:
+            return self._bad_request(operation_info, e)
+        try:
+            with self._token_env(self._get_db(body)) as env:
+                result = env['mobile.sync'].get_changes(body.get('cursors'), body.get('limit'))
+            return self._response(result, operation_info)
+        except AccessDenied:
+            return self._response(operation_info=operation_info, success=False,
+                                  error="Jeton invalide ou expiré", status=401)
+        except Exception as e:
+            _logger.warning(f"Passerelle mobile: échec de la synchronisation: {str(e)}")
+            return self._response(operation_info=operation_info, success=False, error=str(e))
+
+    # ==================== JUSTIFICATIFS ====================
+
+    @http.route('/odoo-rpc/upload/<int:upload_id>/<int:index>', type='http', auth='none', methods=['POST'], csrf=False)
+    def upload_chunk(self, upload_id, index, **kw):
+        """
+        Morceau d'un justificatif (voir hr.expense.upload), envoyé en octets
+        bruts: pas d'encodage base64 ni d'enveloppe JSON. Rejouable.
+        """
+        operation_info = {'operation': 'upload', 'upload_id': upload_id, 'index': index}
+        try:
+            with self._token_env(self._get_db({})) as env:
+                upload = env['hr.expense.upload'].browse(upload_id).exists()
+                if not upload:
+                    return self._response(operation_info=operation_info, success=False,
+                                          error="Envoi inconnu ou expiré", status=404)
+                result = upload.upload_chunk(index, request.httprequest.get_data())
+            return self._response(result, operation_info)
+        except AccessDenied:
+            return self._response(operation_info=operation_info, success=False,
+                                  error="Jeton invalide ou expiré", status=401)
+        except Exception as e:
+            _logger.warning(f"Passerelle mobile: échec de l'envoi du morceau {index} de {upload_id}: {str(e)}")
+            return self._response(operation_info=operation_info, success=False, error=str(e))
@@ -1,3 +1,11 @@
+from . import ws_channel
+from . import ws_dispatcher
+from . import ws_stats
+from . import ws_event
+from . import ws_schema
+from . import mobile_api_token
+from . import ws_tombstone
+from . import mobile_sync
 from . import project_task
 from . import account_analytic_line
 from . import message_follower
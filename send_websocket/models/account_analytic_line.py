@@ -3,52 +3,39 @@ from odoo import models, api
 class AccountAnalyticLine(models.Model):
     _inherit = 'account.analytic.line'
 
+    def _plan_project_updates(self):
+        """
+        Regroupe les lignes par projet (direct ou via la tâche) et programme
+        une seule mise à jour par projet, avec les ids des timesheets en delta
+        """
+        lines_by_project = {}
+        for line in self:
+            project = line.task_id.project_id or line.project_id
+            if project:
+                lines_by_project.setdefault(project.id, []).append(line.id)
+
+        dispatcher = self.env["ws.dispatcher"]
+        for project_id, line_ids in lines_by_project.items():
+            dispatcher.plan(
+                self.env['project.project'].browse(project_id),
+                'get_project_data_for_websocket',
+                changed_timesheet_ids=line_ids,
+            )
+
     @api.model_create_multi
     def create(self, vals_list):
         lines = super(AccountAnalyticLine, self).create(vals_list)
-        for line in lines:
-            if line.task_id:
-                line.task_id._send_project_update(event_type='updated')
-            elif line.project_id:
-                line.project_id.get_project_data_for_websocket(event_type='updated')
+        lines._plan_project_updates()
         return lines
 
     def write(self, vals):
-        old_projects = self.mapped('project_id')
-        old_tasks = self.mapped('task_id')
+        # Projets d'avant et d'après la modification
+        self._plan_project_updates()
         res = super(AccountAnalyticLine, self).write(vals)
-        new_projects = self.mapped('project_id')
-        new_tasks = self.mapped('task_id')
-        
-        # Notifier les projets
-        all_projects = old_projects | new_projects
-        for project in all_projects:
-            project.get_project_data_for_websocket(event_type='updated')
-        
-        # Notifier les tâches
-        all_tasks = old_tasks | new_tasks
-        for task in all_tasks:
-            if task.project_id:
-                task._send_project_update(event_type='updated')
-        
+        self._plan_project_updates()
         return res
 
     def unlink(self):
-        # ✅ Sauvegarder les tâches et projets AVANT suppression
-        tasks_to_notify = self.mapped('task_id')
-        projects_to_notify = self.mapped('project_id')
-        
-        # Supprimer les lignes
-        res = super(AccountAnalyticLine, self).unlink()
-        
-        # ✅ Notifier les tâches et projets APRÈS suppression
-        for task in tasks_to_notify:
-            if task.exists() and task.project_id:
-                task._send_project_update(event_type='updated')
-        
-        for project in projects_to_notify:
-            if project.exists():
-                project.get_project_data_for_websocket(event_type='updated')
-        
-        return res
-
+        # ✅ Programmer les projets AVANT suppression (envoi en fin de transaction)
+        self._plan_project_updates()
+        return super(AccountAnalyticLine, self).unlink()
@@ -1,5 +1,8 @@
 from odoo import models, api
+from odoo.tools import float_compare
+from .ws_dispatcher import ws_silent
 import logging
+import time
 
 _logger = logging.getLogger(__name__)
 
@@ -9,76 +12,37 @@ class HrExpenseAccount(models.Model):
 
     def _prepare_account_payload(self):
         """
-        Prépare le payload pour la notification WebSocket du compte de dépenses
+        Prépare le payload pour la notification WebSocket du compte de dépenses.
+        Les mois sont envoyés en résumé (soldes et nombre de transactions): la
+        taille du message ne dépend pas de l'historique de la caisse. Les
+        transactions se chargent via hr.expense.account.month.get_transactions_page.
         """
         self.ensure_one()
-        
-        # Récupérer les mois associés
+
+        # Nombre de transactions par mois en une seule requête
+        months = self.month_ids
+        transaction_counts = {}
+        if months:
+            transaction_counts = {
+                month.id: count
+                for month, count in self.env['hr.expense.account.move']._read_group(
+                    [('caisse_mois_id', 'in', months.ids)], ['caisse_mois_id'], ['__count'],
+                )
+            }
+
         month_list = []
-        if hasattr(self, 'month_ids') and self.month_ids:
-            for month in self.month_ids:
-                transactions_list = []
-                
-                # Récupérer les transactions du mois
-                if hasattr(month, 'transaction_ids') and month.transaction_ids:
-                    for transaction in month.transaction_ids:
-                        trans_data = {
-                            'id': transaction.id,
-                            'name': transaction.name or '',
-                            'display_name': transaction.display_name or '',
-                            'balance': transaction.balance if hasattr(transaction, 'balance') else 0.0,
-                            'solde_amount': transaction.solde_amount if hasattr(transaction, 'solde_amount') else 0.0,
-                            'expense_move_type': transaction.expense_move_type if hasattr(transaction, 'expense_move_type') else 'spent',
-                            'date': transaction.date.isoformat() if transaction.date else False,
-                            'description': transaction.description if hasattr(transaction, 'description') else False,
-                        }
-                        
-                        # Ajouter l'utilisateur s'il existe
-                        if hasattr(transaction, 'user_id') and transaction.user_id:
-                            trans_data['user_id'] = [
-                                transaction.user_id.id,
-                                transaction.user_id.name
-                            ]
-                        
-                        # Ajouter les champs optionnels s'ils existent
-                        if hasattr(transaction, 'expense_type_id') and transaction.expense_type_id:
-                            trans_data['expense_type_id'] = [
-                                transaction.expense_type_id.id,
-                                transaction.expense_type_id.name
-                            ]
-                        
-                        if hasattr(transaction, 'expense_category_id') and transaction.expense_category_id:
-                            trans_data['expense_category_id'] = [
-                                transaction.expense_category_id.id,
-                                transaction.expense_category_id.name
-                            ]
-                        
-                        if hasattr(transaction, 'project_id') and transaction.project_id:
-                            trans_data['project_id'] = [
-                                transaction.project_id.id,
-                                transaction.project_id.name
-                            ]
-                        
-                        if hasattr(transaction, 'task_id') and transaction.task_id:
-                            trans_data['task_id'] = [
-                                transaction.task_id.id,
-                                transaction.task_id.name
-                            ]
-                        
-                        transactions_list.append(trans_data)
-                
-                month_data = {
-                    'id': month.id,
-                    'name': month.name or '',
-                    'display_name': month.display_name or '',
-                    'caisse_id': [self.id, self.name] if self else False,
-                    'sold': month.sold if hasattr(month, 'sold') else 0.0,
-                    'solde_initial': month.solde_initial if hasattr(month, 'solde_initial') else 0.0,
-                    'solde_final': month.solde_final if hasattr(month, 'solde_final') else 0.0,
-                    'transaction_ids': transactions_list,
-                }
-                month_list.append(month_data)
-        
+        for month in months:
+            month_list.append({
+                'id': month.id,
+                'name': month.name or '',
+                'display_name': month.display_name or '',
+                'caisse_id': [self.id, self.name] if self else False,
+                'solde_initial': month.solde_initial or 0.0,
+                'sold': month.sold or 0.0,
+                'solde_final': month.solde_final or 0.0,
+                'transaction_count': transaction_counts.get(month.id, 0),
+            })
+
         # Construire le payload principal
         return {
             'id': self.id,
@@ -92,10 +56,11 @@ class HrExpenseAccount(models.Model):
             'write_date': self.write_date.isoformat() if self.write_date else False,
         }
 
-    def _send_account_notification(self, event_type='updated'):
+    def _send_account_notification(self, event_type='updated', changed_month_ids=None):
         """
         Envoie une notification WebSocket pour les changements de compte
         Canal privé: geo_lambert_expense_account_{case_id}_{user_id}
+        changed_month_ids: mois modifiés depuis la dernière émission
         """
         for account in self:
             try:
@@ -111,17 +76,14 @@ class HrExpenseAccount(models.Model):
                 # Construire le canal privé
                 channel = f"geo_lambert_expense_account_{account.id}_{user_id}"
                 
-                # Préparer le payload
-                payload = account._prepare_account_payload()
-                payload['event_type'] = event_type
-                
-                # Émettre via ws.notifier
-                self.env["ws.notifier"].send(channel, payload)
-                
-                _logger.info(
-                    f"✅ WebSocket Account émis: {channel} - "
-                    f"event={event_type}, account_id={account.id}"
-                )
+                # Émettre via ws.dispatcher (payload construit à la demande)
+                def _payload(account=account):
+                    payload = account._prepare_account_payload()
+                    if changed_month_ids:
+                        payload['changed_month_ids'] = changed_month_ids
+                    return payload
+
+                self.env["ws.dispatcher"].send(channel, _payload, event_type=event_type, subject=account)
                 
             except Exception as e:
                 _logger.error(
@@ -130,13 +92,71 @@ class HrExpenseAccount(models.Model):
                 )
                 continue
 
+    def _compute_balance(self):
+        """
+        Le solde est recalculé à chaque mouvement (champ calculé stocké), sans
+        passer par write: c'est ici que ses changements sont détectés.
+        L'ancien solde est lu en base, avant l'écriture du nouveau.
+        """
+        accounts = self.filtered('id')
+        old_balances = {}
+        if accounts:
+            self.env.cr.execute(
+                "SELECT id, balance FROM hr_expense_account WHERE id IN %s",
+                [tuple(accounts.ids)],
+            )
+            old_balances = dict(self.env.cr.fetchall())
+
+        super(HrExpenseAccount, self)._compute_balance()
+
+        changed = accounts.filtered(
+            lambda account: account.id not in old_balances
+            or float_compare(account.balance, old_balances[account.id] or 0.0, precision_digits=2) != 0
+        )
+        self.env["ws.dispatcher"].plan(changed, '_send_balance_notification', event_type='balance')
+
+    def _prepare_balance_payload(self):
+        """Solde courant de la caisse: {id, caisse_id, balance, status, version}"""
+        self.ensure_one()
+        return {
+            'id': self.id,
+            'caisse_id': self.id,
+            'balance': self.balance or 0.0,
+            'status': self.status or False,
+            'version': int(time.time() * 1000),
+        }
+
+    def _send_balance_notification(self, event_type='balance'):
+        """
+        Événement léger 'balance' sur le canal de la caisse, et sur le canal
+        privé de son responsable (badge de solde du profil)
+        Canal privé: geo_lambert_expense_account_balance_{case_id}_{user_id}
+        (le dernier entier est le destinataire, voir ws.channel._channel_owner)
+        """
+        for account in self:
+            try:
+                user = account.employee_id.user_id if account.employee_id else False
+                # Fallback: utiliser l'utilisateur actuel, comme _send_account_notification
+                user_id = user.id if user else self.env.user.id
+                channel = f"geo_lambert_expense_account_balance_{account.id}_{user_id}"
+                self.env["ws.dispatcher"].send(
+                    channel, account._prepare_balance_payload, event_type=event_type, subject=account
+                )
+                if user:
+                    user._send_user_balance_notification(event_type=event_type)
+            except Exception as e:
+                _logger.error(
+                    f"❌ Erreur émission WebSocket Balance pour {account.id}: {str(e)}",
+                    exc_info=True
+                )
+                continue
+
     @api.model_create_multi
     def create(self, vals_list):
         """Override create pour envoyer une notification WebSocket"""
         records = super(HrExpenseAccount, self).create(vals_list)
         
-        for record in records:
-            record._send_account_notification(event_type='created')
+        self.env["ws.dispatcher"].plan(records, '_send_account_notification', event_type='created')
         
         return records
 
@@ -144,9 +164,9 @@ class HrExpenseAccount(models.Model):
         """Override write pour envoyer une notification WebSocket"""
         result = super(HrExpenseAccount, self).write(vals)
         
-        # Envoyer notification pour chaque compte modifié
-        for record in self:
-            record._send_account_notification(event_type='updated')
+        # Envoyer notification pour chaque compte modifié (fusionnée avec
+        # celles des mois de la même caisse en fin de transaction)
+        self.env["ws.dispatcher"].plan(self, '_send_account_notification')
         
         return result
 
@@ -182,10 +202,7 @@ class HrExpenseAccount(models.Model):
                     'name': info['name'],
                     'display_name': info['display_name'],
                 }
-                self.env["ws.notifier"].send(channel, payload)
-                _logger.info(
-                    f"✅ WebSocket Account émis (deleted): {channel} - account_id={info['id']}"
-                )
+                self.env["ws.dispatcher"].send(channel, payload)
             except Exception as e:
                 _logger.error(
                     f"❌ Erreur émission WebSocket Account (deleted) pour {info['id']}: {str(e)}"
@@ -193,5 +210,8 @@ class HrExpenseAccount(models.Model):
         
         return result
 
-
-
+    @api.model
+    @ws_silent
+    def create_monthly_record(self):
+        """Cron mensuel: un 'resync' par caisse au lieu d'une notification par mois créé"""
+        return super(HrExpenseAccount, self).create_monthly_record()
@@ -1,4 +1,5 @@
 from odoo import models, api
+from .ws_dispatcher import ws_silent
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -40,7 +41,7 @@ class HrExpenseAccountMove(models.Model):
                     user_id = move.create_uid.id
 
                 if not case_id or not user_id:
-                    _logger.warning(
+                    _logger.debug(
                         f"💸 WebSocket Cashbox: case_id={case_id} ou user_id={user_id} manquant "
                         f"pour expense_move {move.id}"
                     )
@@ -49,44 +50,10 @@ class HrExpenseAccountMove(models.Model):
                 # ✅ Construire le canal privé
                 channel = f"geo_lambert_expense_caisse_{case_id}_{user_id}"
 
-                # ✅ Préparer le payload avec event_type inclus
-                payload = {
-                    'event_type': event_type,
-                    'id': move.id,
-                    'name': move.name or '',
-                    'display_name': move.display_name or '',
-                    'solde_amount': move.solde_amount if hasattr(move, 'solde_amount') else 0.0,
-                    'balance': move.balance if hasattr(move, 'balance') else 0.0,
-                    'expense_move_type': move.expense_move_type if hasattr(move, 'expense_move_type') else 'spent',
-                    'date': move.date.isoformat() if move.date else False,
-                    'description': move.description if move.description else False,
-                    'create_date': move.create_date.isoformat() if move.create_date else False,
-                    'write_date': move.write_date.isoformat() if move.write_date else False,
-                }
-                
-                # ✅ Ajouter l'utilisateur s'il existe
-                if hasattr(move, 'user_id') and move.user_id:
-                    payload['user_id'] = [
-                        move.user_id.id,
-                        move.user_id.name
-                    ]
-
-                # ✅ Ajouter task_id si disponible (array d'objets comme l'API)
-                if hasattr(move, 'task_id') and move.task_id:
-                    payload['task_id'] = [{
-                        'id': move.task_id.id,
-                        'name': move.task_id.name,
-                        'display_name': move.task_id.display_name,
-                    }]
-                else:
-                    payload['task_id'] = []
-
-                # ✅ Émettre via ws.notifier
-                self.env["ws.notifier"].send(channel, payload)
-
-                _logger.info(
-                    f"✅ WebSocket Cashbox émis: {channel} - "
-                    f"event={event_type}, expense_id={move.id}"
+                # ✅ Émettre via ws.dispatcher (payload construit à la demande)
+                self.env["ws.dispatcher"].send(
+                    channel, move._prepare_cashbox_expense_payload, event_type=event_type,
+                    subject=self.env['hr.expense.account'].browse(case_id),
                 )
 
             except Exception as e:
@@ -96,6 +63,20 @@ class HrExpenseAccountMove(models.Model):
                 )
                 continue
 
+    def _prepare_cashbox_expense_payload(self):
+        """
+        Prépare le payload pour le canal privé de la caisse
+        """
+        self.ensure_one()
+        return self.env['ws.schema'].serialize('cashbox_move', self)[0]
+
+    def _prepare_month_transaction_payload(self):
+        """
+        Prépare le payload d'une transaction telle que listée dans un mois
+        """
+        self.ensure_one()
+        return self.env['ws.schema'].serialize('month_transaction', self)[0]
+
     @api.model_create_multi
     def create(self, vals_list):
         """Déclencher WebSocket quand on crée une dépense de caisse"""
@@ -183,6 +164,9 @@ class HrExpenseAccountMove(models.Model):
         tasks_to_notify = self.mapped('task_id').filtered(lambda t: t.exists())
         projects_to_notify = self.mapped('project_id').filtered(lambda p: p.exists())
 
+        # ✅ Trace pour la synchronisation incrémentale (mobile.sync)
+        self.env['ws.tombstone']._record('hr.expense.account.move', {move.id: move.task_id.id for move in self})
+
         # Supprimer les dépenses
         res = super(HrExpenseAccountMove, self).unlink()
 
@@ -196,10 +180,7 @@ class HrExpenseAccountMove(models.Model):
                     'name': info['name'],
                     'display_name': info['display_name'],
                 }
-                self.env["ws.notifier"].send(channel, payload)
-                _logger.info(
-                    f"✅ WebSocket Cashbox émis (deleted): {channel} - expense_id={info['id']}"
-                )
+                self.env["ws.dispatcher"].send(channel, payload)
             except Exception as e:
                 _logger.error(
                     f"❌ Erreur émission WebSocket Cashbox (deleted) pour expense {info['id']}: {str(e)}"
@@ -215,3 +196,9 @@ class HrExpenseAccountMove(models.Model):
                 project.get_project_data_for_websocket(event_type='updated')
 
         return res
+
+    @api.model
+    @ws_silent
+    def recalculate_all_monthly_balances_giniral(self):
+        """Cron de recalcul: un 'resync' par caisse au lieu d'une notification par mois recalculé"""
+        return super(HrExpenseAccountMove, self).recalculate_all_monthly_balances_giniral()
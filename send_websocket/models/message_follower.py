@@ -4,47 +4,57 @@ from odoo import models, api
 class MailFollowers(models.Model):
     _inherit = 'mail.followers'
 
+    def _plan_project_updates(self):
+        """
+        Programme une seule mise à jour par projet concerné, en fin de
+        transaction, avec les ids des followers modifiés en delta
+        """
+        followers_by_project = {}
+        for follower in self:
+            if follower.res_model == 'project.project' and follower.res_id:
+                followers_by_project.setdefault(follower.res_id, []).append(follower.id)
+
+        dispatcher = self.env["ws.dispatcher"]
+        for project_id, follower_ids in followers_by_project.items():
+            dispatcher.plan(
+                self.env['project.project'].browse(project_id),
+                'get_project_data_for_websocket',
+                changed_follower_ids=follower_ids,
+            )
+
     @api.model_create_multi
     def create(self, vals_list):
         """Déclencher WebSocket quand on ajoute un follower"""
         followers = super(MailFollowers, self).create(vals_list)
-        
-        # Envoyer notification pour chaque projet concerné
-        for follower in followers:
-            if follower.res_model == 'project.project' and follower.res_id:
-                project = self.env['project.project'].browse(follower.res_id)
-                if project.exists():
-                    project.get_project_data_for_websocket(event_type='updated')
-        
+        followers._plan_project_updates()
         return followers
 
     def write(self, vals):
         """Déclencher WebSocket quand on modifie un follower"""
         res = super(MailFollowers, self).write(vals)
-        
-        # Envoyer notification pour chaque projet concerné
-        for follower in self:
-            if follower.res_model == 'project.project' and follower.res_id:
-                project = self.env['project.project'].browse(follower.res_id)
-                if project.exists():
-                    project.get_project_data_for_websocket(event_type='updated')
-        
+        self._plan_project_updates()
         return res
 
     def unlink(self):
         """Déclencher WebSocket quand on supprime un follower"""
-        # Récupérer les projets concernés avant la suppression
-        projects_to_notify = self.env['project.project']
-        for follower in self:
-            if follower.res_model == 'project.project' and follower.res_id:
-                project = self.env['project.project'].browse(follower.res_id)
-                if project.exists():
-                    projects_to_notify |= project
-        
+        # Suppression du projet lui-même: ses tombstones sont déjà émis par
+        # project.project.unlink sur tous ses canaux
+        if self.env.context.get('deleting_project'):
+            return super(MailFollowers, self).unlink()
+
+        # Programmer les projets concernés avant la suppression (envoi en fin de transaction)
+        self._plan_project_updates()
+
+        # ✅ Le projet disparaît du canal privé des utilisateurs retirés
+        removed = [
+            (follower.res_id, user_id)
+            for follower in self
+            if follower.res_model == 'project.project' and follower.res_id
+            for user_id in follower.partner_id.user_ids.ids
+        ]
         res = super(MailFollowers, self).unlink()
-        
-        # Envoyer les notifications après la suppression
-        for project in projects_to_notify:
-            project.get_project_data_for_websocket(event_type='updated')
-        
+
+        dispatcher = self.env["ws.dispatcher"]
+        for project_id, user_id in removed:
+            dispatcher.send_tombstone(f'geo_lambert_projects_user_id_{user_id}', 'project.project', project_id)
         return res
@@ -0,0 +1,96 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import AccessError
+from datetime import timedelta
+import hashlib
+import logging
+import secrets
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_TTL_DAYS = 30
+# last_used n'est réécrit qu'au plus une fois par intervalle, pour qu'une
+# requête authentifiée reste une simple lecture indexée
+LAST_USED_REFRESH = timedelta(minutes=5)
+
+
+def _hash_token(token):
+    return hashlib.sha256((token or '').encode('utf-8')).hexdigest()
+
+
+class MobileApiToken(models.Model):
+    """
+    Jeton d'API de la passerelle mobile (/odoo-rpc/...).
+    Échangé une fois contre les identifiants; seul son empreinte SHA-256 est
+    stockée. Un jeton expire, et peut être révoqué (active=False).
+    """
+    _name = 'mobile.api.token'
+    _description = 'Mobile API Token'
+    _order = 'create_date desc'
+
+    name = fields.Char("Appareil")
+    user_id = fields.Many2one('res.users', "Utilisateur", required=True, index=True, ondelete='cascade', readonly=True)
+    token_hash = fields.Char("Empreinte", required=True, index=True, readonly=True, copy=False)
+    expiration_date = fields.Datetime("Expiration", required=True, index=True, readonly=True)
+    last_used = fields.Datetime("Dernière utilisation", readonly=True)
+    active = fields.Boolean("Actif", default=True)
+
+    _sql_constraints = [
+        ('unique_token_hash', 'UNIQUE(token_hash)', 'Un jeton d\'API doit être unique.'),
+    ]
+
+    @api.model
+    def _get_token_ttl(self):
+        param = self.env['ir.config_parameter'].sudo().get_param('send_websocket.api_token_ttl_days')
+        try:
+            return int(param) if param else DEFAULT_TOKEN_TTL_DAYS
+        except ValueError:
+            return DEFAULT_TOKEN_TTL_DAYS
+
+    @api.model
+    def _generate(self, user_id, device_name=None):
+        """Crée un jeton pour user_id et retourne (jeton en clair, enregistrement)"""
+        token = secrets.token_urlsafe(32)
+        record = self.sudo().create({
+            'name': device_name or False,
+            'user_id': user_id,
+            'token_hash': _hash_token(token),
+            'expiration_date': fields.Datetime.now() + timedelta(days=self._get_token_ttl()),
+        })
+        return token, record
+
+    @api.model
+    def _authenticate(self, token):
+        """Retourne l'id de l'utilisateur d'un jeton valide, sinon False"""
+        if not token:
+            return False
+        now = fields.Datetime.now()
+        record = self.sudo().search([
+            ('token_hash', '=', _hash_token(token)),
+            ('expiration_date', '>', now),
+        ], limit=1)
+        if not record or not record.user_id.active:
+            return False
+        if not record.last_used or record.last_used < now - LAST_USED_REFRESH:
+            record.last_used = now
+        return record.user_id.id
+
+    @api.model
+    def _find(self, token):
+        return self.sudo().search([('token_hash', '=', _hash_token(token))], limit=1)
+
+    def action_revoke(self):
+        """Révoque les jetons: seul leur propriétaire ou un administrateur le peut"""
+        if not self.env.user.has_group('base.group_system') and self.sudo().user_id != self.env.user:
+            raise AccessError(_("Vous ne pouvez révoquer que vos propres jetons."))
+        self.sudo().write({'active': False})
+        return True
+
+    @api.model
+    def _cron_purge_expired(self):
+        """Supprime les jetons expirés ou révoqués"""
+        tokens = self.sudo().with_context(active_test=False).search([
+            '|', ('expiration_date', '<=', fields.Datetime.now()), ('active', '=', False),
+        ])
+        _logger.info(f"Passerelle mobile: {len(tokens)} jeton(s) purgé(s)")
+        tokens.unlink()
+        return True
@@ -0,0 +1,86 @@
+from odoo import models, api
+from datetime import datetime
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Modèles synchronisés -> schéma ws.schema de leurs enregistrements
+SYNC_MODELS = {
+    'project.project': 'sync_project',
+    'project.task': 'sync_task',
+    'hr.expense.account.move': 'task_expense',
+}
+DEFAULT_SYNC_LIMIT = 500
+
+
+class MobileSync(models.AbstractModel):
+    """
+    Synchronisation incrémentale de l'application mobile.
+    Curseur par modèle: {'write_date', 'id', 'tombstone_id'}; l'ordre
+    (write_date, id) garantit qu'aucun enregistrement n'est sauté entre deux
+    pages ayant le même write_date.
+    """
+    _name = 'mobile.sync'
+    _description = 'Mobile Incremental Sync'
+
+    @api.model
+    def get_changes(self, cursors=None, limit=DEFAULT_SYNC_LIMIT):
+        """
+        Appelé par l'application (RPC ou POST /odoo-rpc/sync).
+        cursors: {modèle: curseur retourné par l'appel précédent}, vide au
+        premier appel. Retourne par modèle:
+        {'records', 'deleted_ids', 'cursor', 'has_more', 'full_resync'}
+        full_resync=True: des suppressions postérieures au curseur ont été
+        purgées, le client doit recharger ce modèle entièrement.
+        """
+        cursors = cursors or {}
+        limit = min(int(limit or DEFAULT_SYNC_LIMIT), DEFAULT_SYNC_LIMIT)
+        return {
+            model_name: self._get_model_changes(model_name, schema_name, cursors.get(model_name) or {}, limit)
+            for model_name, schema_name in SYNC_MODELS.items()
+        }
+
+    @api.model
+    def _get_model_changes(self, model_name, schema_name, cursor, limit):
+        Tombstone = self.env['ws.tombstone'].sudo()
+        write_date = cursor.get('write_date')
+        last_id = cursor.get('id') or 0
+        tombstone_id = cursor.get('tombstone_id') or 0
+
+        domain = []
+        full_resync = False
+        if write_date:
+            write_date = datetime.fromisoformat(write_date).replace(tzinfo=None)
+            domain = ['|', ('write_date', '>', write_date),
+                      '&', ('write_date', '=', write_date), ('id', '>', last_id)]
+            # Couverture des suppressions, indépendante de l'âge des données:
+            # un modèle sans modification depuis longtemps reste incrémental
+            full_resync = tombstone_id < Tombstone._get_purged_id()
+
+        records = self.env[model_name].search(domain, order='write_date asc, id asc', limit=limit)
+        stable_id = Tombstone._get_stable_id()
+        tombstones = Tombstone.search_fetch(
+            [('model_name', '=', model_name), ('id', '>', tombstone_id)],
+            ['res_id'], order='id asc', limit=limit,
+        ) if write_date else Tombstone
+
+        new_cursor = dict(cursor)
+        if records:
+            new_cursor.update(write_date=records[-1].write_date.isoformat(), id=records[-1].id)
+        # Toutes les suppressions de ce modèle sont lues (ou premier appel:
+        # les suppressions antérieures ne concernent pas le client): le
+        # curseur avance jusqu'à la dernière suppression, tous modèles
+        # confondus. Il ne dépasse jamais stable_id: les suppressions récentes
+        # sont renvoyées à nouveau au prochain appel (sans effet côté client)
+        # plutôt que de sauter une suppression validée en retard
+        reached_id = stable_id if len(tombstones) < limit else min(tombstones[-1].id, stable_id)
+        new_cursor['tombstone_id'] = max(reached_id, tombstone_id)
+
+        return {
+            'records': self.env['ws.schema'].serialize(schema_name, records),
+            'deleted_ids': tombstones.mapped('res_id'),
+            'cursor': new_cursor,
+            'has_more': len(records) == limit or (
+                len(tombstones) == limit and new_cursor['tombstone_id'] > tombstone_id),
+            'full_resync': full_resync,
+        }
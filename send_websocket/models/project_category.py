@@ -26,7 +26,7 @@ class ProjectCategory(models.Model):
             payload = self._prepare_category_payload()
             payload['event_type'] = event_type
             
-            self.env["ws.notifier"].send(channel_name, payload)
+            self.env["ws.dispatcher"].send(channel_name, payload)
             
         except Exception as e:
             # Log error but don't block the operation
@@ -69,7 +69,7 @@ class ProjectCategory(models.Model):
         try:
             channel_name = 'geo_lambert_category_projects'
             for payload in payloads:
-                self.env["ws.notifier"].send(channel_name, payload)
+                self.env["ws.dispatcher"].send(channel_name, payload)
                 
         except Exception as e:
             import logging
@@ -1,89 +1,142 @@
 from odoo import models, fields, api
+import functools
+
+# Champs écrits par le timer: une écriture limitée à ces champs ne déclenche
+# que l'événement 'timer', pas le payload complet du projet
+TIMER_FIELDS = {
+    'timer_start', 'timer_pause', 'is_timer_running', 'user_timer_id',
+    'display_timer_start_primary', 'display_timer_start_secondary',
+}
 
 class ProjectProject(models.Model):
     _inherit = 'project.project'
 
-    def get_project_data_for_websocket(self, event_type='updated', channel='geo_lambert_expenses', deleted_task_id=None, deleted_expense_id=None, task_id_with_deleted_expense=None):
+    def _get_websocket_channels(self):
+        """
+        Canaux destinataires d'un projet: un canal par utilisateur follower
+        (geo_lambert_projects_user_id_{user_id}), plus le canal partagé
+        geo_lambert_expenses si la diffusion historique est réactivée
+        (send_websocket.project_broadcast, désactivée par défaut)
+        """
+        self.ensure_one()
+        users = self.sudo().message_follower_ids.partner_id.user_ids
+        channels = [f'geo_lambert_projects_user_id_{user_id}' for user_id in sorted(set(users.ids))]
+        if self.env['ws.dispatcher']._is_project_broadcast_enabled():
+            channels.insert(0, 'geo_lambert_expenses')
+        return channels
+
+    def get_project_data_for_websocket(self, event_type='updated', channel=None, deleted_task_id=None, deleted_expense_id=None, task_id_with_deleted_expense=None, changed_follower_ids=None, changed_timesheet_ids=None):
+        Channel = self.env['ws.channel']
         for project in self:
-            task_list = []
-            for task in project.tasks:
-                task_list.append(task.get_task_data_for_websocket())
-
-            # ✅ Récupérer les followers du projet
-            follower_list = []
-            for follower in project.message_follower_ids:
-                follower_data = {
-                    'id': follower.id,
-                    # ✅ Format ARRAY comme l'API pour compatibilité avec le filtrage TypeScript
-                    'partner_id': [{
-                        'id': follower.partner_id.id,
-                        'name': follower.partner_id.name,
-                        'display_name': follower.partner_id.display_name,
-                    }] if follower.partner_id else [],
-                    'partner_name': follower.partner_id.name if follower.partner_id else False,
-                    'partner_email': follower.partner_id.email if follower.partner_id else False,
-                }
-                follower_list.append(follower_data)
-
-            # 🔍 Déboguer le nom exact du champ de catégorie
-            import logging
-            _logger = logging.getLogger(__name__)
-            
-            # Vérifier tous les champs possibles
-            category_id = False
-            category_field_name = None
-            
-            if hasattr(project, 'project_category_id') and project.project_category_id:
-                category_id = project.project_category_id.id
-                category_field_name = 'project_category_id'
-            elif hasattr(project, 'category_id') and project.category_id:
-                category_id = project.category_id.id
-                category_field_name = 'category_id'
-            elif hasattr(project, 'categ_id') and project.categ_id:
-                category_id = project.categ_id.id
-                category_field_name = 'categ_id'
-            
-            _logger.info(f"🔍 WebSocket Projet {project.id} ({project.name}):")
-            _logger.info(f"   ➡️ Champ catégorie utilisé: {category_field_name}")
-            _logger.info(f"   ➡️ Category ID: {category_id}")
-            
-            # Si aucun champ n'est trouvé, logger tous les champs disponibles contenant 'categ' ou 'category'
-            if not category_id:
-                available_fields = [f for f in dir(project) if 'categ' in f.lower() or 'category' in f.lower()]
-                _logger.warning(f"⚠️ Aucun champ de catégorie trouvé! Champs disponibles: {available_fields}")
-
-            payload = {
-                'id': project.id,
-                'name': project.name,
-                'project_type': project.project_type if hasattr(project, 'project_type') else False,
-                'partner_id': project.partner_id.id if project.partner_id else False,
-                'date_start': project.date_start.isoformat() if project.date_start else False,
-                'date': project.date.isoformat() if project.date else False,
-                'tasks': task_list,
-                'numero': project.numero if hasattr(project, 'numero') else False,
-                'message_follower_ids': follower_list,
-                'privacy_visibility': project.privacy_visibility if hasattr(project, 'privacy_visibility') else False,
-                'event_type': event_type,
-                'create_date': project.create_date.isoformat() if project.create_date else False,
-                'write_date': project.write_date.isoformat() if project.write_date else False,
-                'project_source': project.project_source if project.project_source else False,
-                # ✅ Utiliser le category_id trouvé via le debug ci-dessus
-                'category_id': category_id,
-                # ✅ Ajouter type_ids pour l'affichage dans l'UI
-                'type_ids': [{'id': t.id, 'name': t.name, 'display_name': t.display_name} for t in project.type_ids] if hasattr(project, 'type_ids') and project.type_ids else [],
-            }
-
-            # ✅ Ajouter l'ID de la tâche supprimée si applicable
-            if deleted_task_id:
-                payload['deleted_task_id'] = deleted_task_id
-
-            # ✅ Ajouter l'ID de la dépense supprimée si applicable
-            if deleted_expense_id:
-                payload['deleted_expense_id'] = deleted_expense_id
-                if task_id_with_deleted_expense:
-                    payload['task_id_with_deleted_expense'] = task_id_with_deleted_expense
-
-            self.env["ws.notifier"].send(channel, payload)
+            built = {}
+
+            def _payload(user_id=False, project=project, built=built):
+                # Construit une fois par destinataire, avec ses droits: un
+                # follower ne reçoit que les tâches et dépenses qu'il peut lire
+                if user_id not in built:
+                    recipient = project.with_user(user_id) if user_id else project
+                    built[user_id] = recipient._prepare_project_payload()
+                payload = dict(built[user_id])
+
+                # ✅ Ajouter l'ID de la tâche supprimée si applicable
+                if deleted_task_id:
+                    payload['deleted_task_id'] = deleted_task_id
+
+                # ✅ Ajouter l'ID de la dépense supprimée si applicable
+                if deleted_expense_id:
+                    payload['deleted_expense_id'] = deleted_expense_id
+                    if task_id_with_deleted_expense:
+                        payload['task_id_with_deleted_expense'] = task_id_with_deleted_expense
+
+                # ✅ Followers / timesheets modifiés depuis la dernière émission
+                if changed_follower_ids:
+                    payload['changed_follower_ids'] = changed_follower_ids
+                if changed_timesheet_ids:
+                    payload['changed_timesheet_ids'] = changed_timesheet_ids
+                return payload
+
+            for project_channel in ([channel] if channel else project._get_websocket_channels()):
+                user_id = Channel._channel_owner(project_channel)
+                if user_id and not project.with_user(user_id).has_access('read'):
+                    continue
+                self.env["ws.dispatcher"].send(
+                    project_channel, functools.partial(_payload, user_id), event_type=event_type, subject=project
+                )
+
+    def _get_mobile_card_aggregates(self):
+        """
+        Totaux des cartes de projet en une requête groupée par modèle:
+        {project_id: {task_count, total_depenses, hours, last_activity}}
+        total_depenses reprend la définition du champ calculé (dépenses 'spent').
+        """
+        aggregates = {project.id: {
+            'task_count': 0,
+            'total_depenses': 0.0,
+            'hours': 0.0,
+            'last_activity': project.write_date,
+        } for project in self}
+
+        def _touch(project, date):
+            current = aggregates[project.id]['last_activity']
+            if date and (not current or date > current):
+                aggregates[project.id]['last_activity'] = date
+
+        domain = [('project_id', 'in', self.ids)]
+        for project, count, last_write in self.env['project.task']._read_group(
+                domain, ['project_id'], ['__count', 'write_date:max']):
+            aggregates[project.id]['task_count'] = count
+            _touch(project, last_write)
+        for project, move_type, total, last_write in self.env['hr.expense.account.move']._read_group(
+                domain, ['project_id', 'expense_move_type'], ['total_amount:sum', 'write_date:max']):
+            if move_type == 'spent':
+                aggregates[project.id]['total_depenses'] = total
+            _touch(project, last_write)
+        for project, hours, last_write in self.env['account.analytic.line']._read_group(
+                domain, ['project_id'], ['unit_amount:sum', 'write_date:max']):
+            aggregates[project.id]['hours'] = hours
+            _touch(project, last_write)
+        return aggregates
+
+    @api.model
+    def get_mobile_project_feed(self, offset=0, limit=20, domain=None, followed_only=False):
+        """
+        Fil paginé de l'écran d'accueil mobile: cartes de projet avec
+        nombre de tâches, total des dépenses, heures et dernière activité,
+        sans tâches imbriquées (voir get_mobile_project_tasks).
+        """
+        domain = list(domain or [])
+        if followed_only:
+            domain.append(('message_partner_ids', 'in', self.env.user.partner_id.ids))
+        projects = self.search(domain, offset=offset, limit=limit, order='write_date desc, id desc')
+        aggregates = projects._get_mobile_card_aggregates()
+        cards = self.env['ws.schema'].serialize('project_card', projects)
+        for card in cards:
+            values = aggregates[card['id']]
+            card.update(values, last_activity=values['last_activity'].isoformat() if values['last_activity'] else False)
+        return {
+            'total': self.search_count(domain),
+            'offset': offset,
+            'limit': limit,
+            'projects': cards,
+        }
+
+    def get_mobile_project_tasks(self, offset=0, limit=50):
+        """Tâches d'un projet, chargées à l'ouverture du projet dans l'application"""
+        self.ensure_one()
+        Task = self.env['project.task']
+        domain = [('project_id', '=', self.id)]
+        tasks = Task.search(domain, offset=offset, limit=limit)
+        return {
+            'project_id': self.id,
+            'total': Task.search_count(domain),
+            'offset': offset,
+            'limit': limit,
+            'tasks': self.env['ws.schema'].serialize('task', tasks),
+        }
+
+    def _prepare_project_payload(self):
+        self.ensure_one()
+        return self.env['ws.schema'].serialize('project', self)[0]
 
     @api.model_create_multi
     def create(self, vals_list):
@@ -97,12 +150,19 @@ class ProjectProject(models.Model):
         return res
 
     def unlink(self):
-        # 📢 Envoyer l'événement de suppression du projet
-        self.get_project_data_for_websocket(event_type='deleted')
+        channels_by_project = {project.id: project._get_websocket_channels() for project in self}
+        self.env['ws.tombstone']._record('project.project', dict.fromkeys(self.ids, 0))
 
         # ✅ Ajouter un flag dans le contexte pour indiquer qu'on supprime un projet
         # Cela permettra aux tâches de ne pas envoyer d'événements lors de leur suppression en cascade
-        return super(ProjectProject, self.with_context(deleting_project=True)).unlink()
+        res = super(ProjectProject, self.with_context(deleting_project=True)).unlink()
+
+        # 📢 Tombstone de suppression: aucun chargement des tâches ni des dépenses
+        dispatcher = self.env["ws.dispatcher"]
+        for project_id, channels in channels_by_project.items():
+            for channel in channels:
+                dispatcher.send_tombstone(channel, 'project.project', project_id)
+        return res
 
 class ProjectTask(models.Model):
     _inherit = 'project.task'
@@ -137,210 +197,94 @@ class ProjectTask(models.Model):
         return tasks
 
     def write(self, vals):
-        # Any change to a task will trigger a websocket notification.
-        # This includes changes to the timer-related fields (is_timer_running, timer_pause, timer_start).
+        # Any change to a task will trigger a websocket notification, except
+        # timer-only writes: those are covered by the lightweight timer event.
         res = super(ProjectTask, self).write(vals)
-        self._send_project_update(event_type='updated')
+        if not set(vals) <= TIMER_FIELDS:
+            self._send_project_update(event_type='updated')
         return res
 
+    def _prepare_timer_payload(self):
+        """Payload minimal de l'état du timer d'une tâche"""
+        self.ensure_one()
+        return self.env['ws.schema'].serialize('task_timer', self)[0]
+
+    @api.model
+    def get_timer_states(self, task_ids=None):
+        """
+        État du timer de plusieurs tâches en un seul appel (liste de tâches mobile).
+        task_ids: ids des tâches, sinon toutes les tâches assignées à l'utilisateur.
+        server_time (UTC, même format que timer_start) permet au client de
+        calculer le temps écoulé localement, sans interroger à nouveau.
+        """
+        if task_ids is None:
+            tasks = self.search([('user_ids', 'in', self.env.uid)])
+        else:
+            tasks = self.browse(task_ids).exists()
+        return {
+            'server_time': fields.Datetime.now().isoformat(),
+            'tasks': self.env['ws.schema'].serialize('task_timer', tasks),
+        }
+
+    def _send_timer_event(self, timer_action):
+        """
+        Émet l'état du timer sur le canal privé de l'utilisateur courant,
+        sans reconstruire le payload complet du projet
+        Canal privé: geo_lambert_tasks_user_id_{user_id}
+        """
+        channel = f'geo_lambert_tasks_user_id_{self.env.user.id}'
+        for task in self:
+            def _payload(task=task):
+                payload = task._prepare_timer_payload()
+                payload['timer_action'] = timer_action
+                return payload
+
+            self.env["ws.dispatcher"].send(channel, _payload, event_type='timer', subject=task)
+
     def action_timer_start(self):
         res = super(ProjectTask, self).action_timer_start()
-        channel = f'geo_lambert_tasks_user_id_{self.env.user.id}'
-        self._send_project_update(channel=channel)
+        self._send_timer_event('start')
         return res
 
     def action_timer_pause(self):
         res = super(ProjectTask, self).action_timer_pause()
-        channel = f'geo_lambert_tasks_user_id_{self.env.user.id}'
-        self._send_project_update(channel=channel)
+        self._send_timer_event('pause')
         return res
 
     def action_timer_stop(self):
         res = super(ProjectTask, self).action_timer_stop()
-        channel = f'geo_lambert_tasks_user_id_{self.env.user.id}'
-        self._send_project_update(channel=channel)
+        self._send_timer_event('stop')
         return res
 
     def action_timer_resume(self):
         res = super(ProjectTask, self).action_timer_resume()
-        channel = f'geo_lambert_tasks_user_id_{self.env.user.id}'
-        self._send_project_update(channel=channel)
+        self._send_timer_event('resume')
         return res
 
     def unlink(self):
         """Déclencher WebSocket quand on supprime une tâche"""
         # ✅ Si on est en train de supprimer un projet parent, ne pas envoyer d'événements
         if self.env.context.get('deleting_project'):
+            self.env['ws.tombstone']._record('project.task', {task.id: task.project_id.id for task in self})
             return super(ProjectTask, self).unlink()
 
-        # ✅ Sauvegarder les projets et IDs de tâches AVANT suppression
-        tasks_data = [(task.id, task.project_id) for task in self if task.project_id and task.project_id.exists()]
+        # ✅ Sauvegarder les IDs de tâches et de projets AVANT suppression
+        tasks_data = [(task.id, task.project_id.id) for task in self]
+        self.env['ws.tombstone']._record('project.task', dict(tasks_data))
+        channels_by_project = {project.id: project._get_websocket_channels() for project in self.project_id}
 
         # Supprimer les tâches
         res = super(ProjectTask, self).unlink()
 
-        # ✅ Notifier les projets APRÈS suppression avec l'ID de la tâche supprimée
-        for task_id, project in tasks_data:
-            if project.exists():
-                project.get_project_data_for_websocket(
-                    event_type='updated',
-                    deleted_task_id=task_id
-                )
+        # ✅ Tombstone par tâche, sans re-sérialiser le projet survivant
+        # (une tâche sans projet n'est diffusée sur aucun canal projet)
+        dispatcher = self.env["ws.dispatcher"]
+        for task_id, project_id in tasks_data:
+            for channel in channels_by_project.get(project_id, []):
+                dispatcher.send_tombstone(channel, 'project.task', task_id, parent_id=project_id)
 
         return res
 
     def get_task_data_for_websocket(self):
         self.ensure_one()
-        user_list = []
-        for user in self.user_ids:
-            user_list.append({
-                'id': user.id,
-                'display_name': user.display_name,
-                'name': user.name,
-            })
-
-        expense_list = []
-        if hasattr(self, 'expense_ids'):
-            # ✅ Filtrer uniquement les dépenses qui existent encore
-            existing_expenses = self.expense_ids.exists()
-            for expense in existing_expenses:
-                try:
-                    expense_list.append({
-                        'id': expense.id,
-                        'expense_date': expense.expense_date.isoformat() if expense.expense_date else False,
-                        'amount': expense.amount,
-                        'expense_category_id': [{
-                            'id': expense.expense_category_id.id,
-                            'display_name': expense.expense_category_id.display_name,
-                            'name': expense.expense_category_id.name,
-                        }] if expense.expense_category_id else [],
-                        'display_name': expense.display_name,
-                        'project_id': [self.project_id.id, self.project_id.name] if self.project_id else [],
-                        'task_id': [self.id, self.name] if self else [],
-                        'total_amount': expense.total_amount,
-                        'solde_amount': expense.solde_amount,
-                        'balance': expense.balance,
-                        'expense_move_type': expense.expense_move_type,
-                        'date': expense.date,
-                        'description': expense.description,
-                        'expense_type_id': [{
-                            'id': expense.expense_type_id.id,
-                            'display_name': expense.expense_type_id.display_name,
-                            'name': expense.expense_type_id.name,
-                        }] if hasattr(expense, 'expense_type_id') and expense.expense_type_id else [],
-                        'currency_id': [expense.currency_id.id,
-                                        expense.currency_id.name] if expense.currency_id else [],
-                    })
-                except Exception:
-                    # Si une erreur survient lors de la lecture d'une dépense, l'ignorer
-                    continue
-
-        # ✅ Récupérer les timesheets (account.analytic.line)
-        timesheet_list = []
-        try:
-            timesheets = self.env['account.analytic.line'].search([
-                ('task_id', '=', self.id)
-            ], order='date desc')
-
-            for timesheet in timesheets:
-                try:
-                    timesheet_list.append({
-                        'id': timesheet.id,
-                        'name': timesheet.name or 'Timesheet',
-                        'date': timesheet.date.isoformat() if timesheet.date else False,
-                        'unit_amount': timesheet.unit_amount or 0.0,
-                        'amount': timesheet.amount or 0.0,
-                        'employee_id': [timesheet.employee_id.id,
-                                        timesheet.employee_id.name] if timesheet.employee_id else [],
-                        'project_id': [timesheet.project_id.id,
-                                       timesheet.project_id.name] if timesheet.project_id else [],
-                        'task_id': [self.id, self.name],
-                    })
-                except Exception:
-                    # Si une erreur survient lors de la lecture d'un timesheet, l'ignorer
-                    continue
-        except Exception:
-            # Si erreur globale, continuer avec une liste vide
-            pass
-
-        # ✅ Récupérer les dépenses de caisse (hr.expense.account.move)
-        expense_move_list = []
-        try:
-            expense_moves = self.env['hr.expense.account.move'].search([
-                ('task_id', '=', self.id)
-            ], order='date desc')
-
-            for expense_move in expense_moves:
-                try:
-                    expense_move_list.append({
-                        'id': expense_move.id,
-                        'name': expense_move.name or 'Dépense',
-                        'designation': expense_move.designation or '',
-                        'date': expense_move.date.isoformat() if expense_move.date else False,
-                        'total_amount': expense_move.total_amount or 0.0,
-                        # ✅ IMPORTANT: Ajouter solde_amount pour que TypeScript calcule correctement
-                        'solde_amount': expense_move.solde_amount if hasattr(expense_move, 'solde_amount') else (
-                                    expense_move.total_amount or 0.0),
-                        # ✅ Ajouter balance aussi comme fallback
-                        'balance': expense_move.balance if hasattr(expense_move, 'balance') else (
-                                    expense_move.total_amount or 0.0),
-                        # ✅ Ajouter amount comme fallback
-                        'amount': expense_move.amount if hasattr(expense_move, 'amount') else (
-                                    expense_move.total_amount or 0.0),
-                        'expense_move_type': expense_move.expense_move_type or 'spent',
-                        'expense_category_id': {
-                            'id': expense_move.expense_category_id.id,
-                            'display_name': expense_move.expense_category_id.display_name,
-                            'name': expense_move.expense_category_id.name,
-                        } if expense_move.expense_category_id else None,
-                        'expense_type_id': {
-                            'id': expense_move.expense_type_id.id,
-                            'display_name': expense_move.expense_type_id.display_name,
-                            'name': expense_move.expense_type_id.name,
-                        } if expense_move.expense_type_id else None,
-                        'employee_id': {
-                            'id': expense_move.employee_id.id,
-                            'display_name': expense_move.employee_id.display_name,
-                            'name': expense_move.employee_id.name,
-                        } if expense_move.employee_id else None,
-                        'expense_account_id': {
-                            'id': expense_move.expense_account_id.id,
-                            'display_name': expense_move.expense_account_id.display_name,
-                            'name': expense_move.expense_account_id.name,
-                        } if expense_move.expense_account_id else None,
-                        'project_id': {
-                            'id': self.project_id.id,
-                            'display_name': self.project_id.display_name,
-                            'name': self.project_id.name,
-                        } if self.project_id else None,
-                        'task_id': {
-                            'id': self.id,
-                            'display_name': self.display_name,
-                            'name': self.name,
-                        },
-                        'currency_id': {
-                            'id': expense_move.currency_id.id,
-                            'display_name': expense_move.currency_id.display_name,
-                            'name': expense_move.currency_id.name,
-                            'symbol': expense_move.currency_id.symbol,
-                        } if expense_move.currency_id else None,
-                    })
-                except Exception:
-                    # Si une erreur survient lors de la lecture d'une dépense, l'ignorer
-                    continue
-        except Exception:
-            # Si erreur globale, continuer avec une liste vide
-            pass
-
-        return {
-            'id': self.id,
-            'timer_start': self.timer_start.isoformat() if self.timer_start else False,
-            'timer_pause': self.timer_pause.isoformat() if self.timer_pause else False,
-            'user_ids': user_list,
-            'timesheet_ids': timesheet_list,
-            'expense_ids': expense_move_list,
-            'display_name': self.display_name,
-            'name': self.name,
-            'partner_id': self.partner_id.id if self.partner_id else False,
-            'state': self.state if hasattr(self, 'state') else False
-        }
\ No newline at end of file
+        return self.env['ws.schema'].serialize('task', self)[0]
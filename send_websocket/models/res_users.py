@@ -1,36 +1,50 @@
-from odoo import models, api
+from odoo import models, api, tools
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Champs res.users (et champs partenaire hérités) présents dans _prepare_user_payload.
+# login_date et write_date sont volontairement exclus.
+USER_PAYLOAD_FIELDS = {
+    'name', 'login', 'email', 'lang', 'tz', 'active', 'notification_type', 'signature',
+    'partner_id', 'company_id', 'groups_id', 'employee_ids',
+    'phone', 'mobile', 'street', 'street2', 'city', 'state_id', 'country_id', 'zip',
+    'function', 'title', 'is_company',
+}
+
+# Champs res.partner présents dans _prepare_user_payload
+PARTNER_PAYLOAD_FIELDS = {
+    'name', 'email', 'phone', 'mobile', 'street', 'street2', 'city', 'state_id',
+    'country_id', 'zip', 'function', 'title', 'is_company', 'image_1920',
+}
+
 
 class ResUsers(models.Model):
     _inherit = 'res.users'
 
-    def _prepare_user_payload(self):
+    def _get_profile_cache_key(self):
         """
-        Prépare le payload pour la notification WebSocket de l'utilisateur
+        Version de la partie statique du profil: langue (noms de groupes
+        traduits), write_date de l'utilisateur, du partenaire et de la société,
+        plus les groupes (l'ajout d'un utilisateur à un groupe ne touche pas
+        son write_date; un groupe renommé vide le cache, voir ResGroups).
+        None si l'un d'eux a été modifié dans la transaction courante: write_date
+        vaut alors cr.now() et ne distingue pas deux écritures successives.
         """
         self.ensure_one()
-        
-        # Récupérer les informations de l'employé associé
-        employee = self.employee_id if hasattr(self, 'employee_id') else False
-        
-        # Récupérer le case_id depuis l'employé ou le compte de dépenses
-        case_id = False
-        balance = 0.0
-        
-        if employee:
-            # Chercher le compte de dépenses associé à l'employé
-            expense_account = self.env['hr.expense.account'].search([
-                ('employee_id', '=', employee.id)
-            ], limit=1)
-            
-            if expense_account:
-                case_id = expense_account.id
-                balance = expense_account.balance if hasattr(expense_account, 'balance') else 0.0
-        
-        # Construire le payload complet
+        stamps = (self.write_date, self.partner_id.write_date, self.company_id.write_date)
+        if self.env.cr.now() in stamps:
+            return None
+        return (self.env.lang,) + stamps + (tuple(self.groups_id.ids),)
+
+    @tools.ormcache('user_id', 'cache_key')
+    def _get_static_profile(self, user_id, cache_key):
+        """Partie du profil qui change rarement (identité, adresse, société, groupes)"""
+        return self.browse(user_id)._build_static_profile()
+
+    def _build_static_profile(self):
+        self.ensure_one()
+        partner = self.partner_id
         return {
             'id': self.id,
             'uid': self.id,  # Pour compatibilité
@@ -41,53 +55,104 @@ class ResUsers(models.Model):
             'user_name': self.name,
             'user_login': self.login,
             'username': self.login,
-            
-            # Informations de l'employé
-            'employee_id': str(employee.id) if employee else False,
-            'case_id': case_id,
-            'balance': balance,
-            
+
             # Informations du partenaire
-            'partner_id': self.partner_id.id if self.partner_id else False,
-            'partner_name': self.partner_id.name if self.partner_id else '',
-            'phone': self.partner_id.phone if self.partner_id else '',
-            'mobile': self.partner_id.mobile if self.partner_id else '',
-            'street': self.partner_id.street if self.partner_id else '',
-            'street2': self.partner_id.street2 if self.partner_id else '',
-            'city': self.partner_id.city if self.partner_id else '',
-            'state_id': self.partner_id.state_id.name if self.partner_id and self.partner_id.state_id else '',
-            'country_id': self.partner_id.country_id.name if self.partner_id and self.partner_id.country_id else '',
-            'zip': self.partner_id.zip if self.partner_id else '',
-            
+            'partner_id': partner.id if partner else False,
+            'partner_name': partner.name if partner else '',
+            'phone': partner.phone if partner else '',
+            'mobile': partner.mobile if partner else '',
+            'street': partner.street if partner else '',
+            'street2': partner.street2 if partner else '',
+            'city': partner.city if partner else '',
+            'zip': partner.zip if partner else '',
+
             # Informations de la société
             'company_id': self.company_id.id if self.company_id else False,
             'company_name': self.company_id.name if self.company_id else '',
-            'is_company': self.partner_id.is_company if self.partner_id else False,
-            
+            'is_company': partner.is_company if partner else False,
+
             # Autres informations
-            'function': self.partner_id.function if self.partner_id else '',
-            'title': self.partner_id.title.name if self.partner_id and self.partner_id.title else '',
+            'function': partner.function if partner else '',
             'lang': self.lang if self.lang else 'fr_FR',
             'tz': self.tz if self.tz else 'Europe/Paris',
             'active': self.active,
-            
+
             # Permissions
             'is_admin': self.has_group('base.group_system'),
             'groups': [g.full_name for g in self.groups_id] if self.groups_id else [],
-            
+
             # Image et signature
             'image_url': f"/web/image/res.users/{self.id}/avatar_128" if self.id else '',
             'signature': self.signature if hasattr(self, 'signature') and self.signature else '',
-            
-            # Dates
+
             'create_date': self.create_date.isoformat() if self.create_date else False,
-            'login_date': self.login_date.isoformat() if hasattr(self, 'login_date') and self.login_date else False,
-            'write_date': self.write_date.isoformat() if self.write_date else False,
-            
+
             # Notification
             'notification_type': self.notification_type if hasattr(self, 'notification_type') else 'email',
         }
 
+    def _prepare_balance_payload(self):
+        """
+        Partie volatile du profil: caisse de l'employé et son solde.
+        Émise seule par l'événement 'balance'.
+        """
+        self.ensure_one()
+        employee = self.employee_id if hasattr(self, 'employee_id') else False
+        case_id = False
+        balance = 0.0
+        if employee:
+            # Chercher le compte de dépenses associé à l'employé
+            expense_account = self.env['hr.expense.account'].search([
+                ('employee_id', '=', employee.id)
+            ], limit=1)
+            if expense_account:
+                case_id = expense_account.id
+                balance = expense_account.balance if hasattr(expense_account, 'balance') else 0.0
+        return {
+            'id': self.id,
+            'employee_id': str(employee.id) if employee else False,
+            'case_id': case_id,
+            'balance': balance,
+        }
+
+    def _prepare_user_payload(self):
+        """
+        Prépare le payload pour la notification WebSocket de l'utilisateur:
+        partie statique en cache + partie volatile (solde)
+        """
+        self.ensure_one()
+        cache_key = self._get_profile_cache_key()
+        if cache_key is None:
+            payload = self._build_static_profile()
+        else:
+            # Copie: le dictionnaire en cache est partagé
+            payload = dict(self._get_static_profile(self.id, cache_key))
+        # Noms traduits d'enregistrements liés: hors cache, leur renommage ne
+        # change pas la clé du cache
+        partner = self.partner_id
+        payload.update({
+            'state_id': partner.state_id.name if partner and partner.state_id else '',
+            'country_id': partner.country_id.name if partner and partner.country_id else '',
+            'title': partner.title.name if partner and partner.title else '',
+        })
+        payload.update(self._prepare_balance_payload())
+        payload.update({
+            'login_date': self.login_date.isoformat() if hasattr(self, 'login_date') and self.login_date else False,
+            'write_date': self.write_date.isoformat() if self.write_date else False,
+        })
+        return payload
+
+    def _send_user_balance_notification(self, event_type='balance'):
+        """
+        Événement léger 'balance' sur le canal privé de l'utilisateur:
+        {id, employee_id, case_id, balance}, sans le profil complet
+        """
+        for user in self:
+            channel = f"geo_lambert_res_users_id_{user.id}"
+            self.env["ws.dispatcher"].send(
+                channel, user._prepare_balance_payload, event_type=event_type, subject=user
+            )
+
     def _send_user_auth_notification(self, event_type='updated'):
         """
         Envoie une notification WebSocket pour les changements du profil utilisateur
@@ -98,16 +163,9 @@ class ResUsers(models.Model):
                 # Construire le canal privé
                 channel = f"geo_lambert_res_users_id_{user.id}"
                 
-                # Préparer le payload
-                payload = user._prepare_user_payload()
-                payload['event_type'] = event_type
-                
-                # Émettre via ws.notifier
-                self.env["ws.notifier"].send(channel, payload)
-                
-                _logger.info(
-                    f"✅ WebSocket User Auth émis: {channel} - "
-                    f"event={event_type}, user_id={user.id}, display_name={user.display_name}"
+                # Émettre via ws.dispatcher (payload construit à la demande)
+                self.env["ws.dispatcher"].send(
+                    channel, user._prepare_user_payload, event_type=event_type, subject=user
                 )
                 
             except Exception as e:
@@ -117,45 +175,45 @@ class ResUsers(models.Model):
                 )
                 continue
 
+    def _ws_payload_fields(self, vals):
+        """
+        Retourne les champs de vals qui alimentent _prepare_user_payload.
+        Les écritures techniques (login_date, write_date, préférences non
+        exposées...) ne déclenchent donc aucune notification.
+        """
+        fnames = {fname for fname in vals if fname in USER_PAYLOAD_FIELDS}
+        # Champs de groupes "réifiés" du formulaire utilisateur
+        if any(fname.startswith(('in_group_', 'sel_groups_')) for fname in vals):
+            fnames.add('groups_id')
+        return [fname for fname in fnames if fname in self._fields]
+
+    def _ws_field_values(self, fnames):
+        """Valeurs comparables des champs fnames (ids pour les relations)"""
+        self.ensure_one()
+        values = []
+        for fname in fnames:
+            value = self[fname]
+            if isinstance(value, models.BaseModel):
+                value = tuple(sorted(value.ids))
+            values.append(value)
+        return tuple(values)
+
     def write(self, vals):
         """Override write pour envoyer une notification WebSocket"""
-        # Sauvegarder les anciennes valeurs importantes
-        old_values = {}
-        for user in self:
-            old_values[user.id] = {
-                'balance': 0.0,
-                'case_id': False
-            }
-            
-            # Récupérer l'ancienne balance si possible
-            if user.employee_id:
-                expense_account = self.env['hr.expense.account'].search([
-                    ('employee_id', '=', user.employee_id.id)
-                ], limit=1)
-                if expense_account:
-                    old_values[user.id]['balance'] = expense_account.balance if hasattr(expense_account, 'balance') else 0.0
-                    old_values[user.id]['case_id'] = expense_account.id
-        
+        fnames = self._ws_payload_fields(vals)
+        if not fnames:
+            return super(ResUsers, self).write(vals)
+
+        # Sauvegarder les anciennes valeurs des seuls champs exposés
+        old_values = {user.id: user._ws_field_values(fnames) for user in self}
+
         # Effectuer la modification
         result = super(ResUsers, self).write(vals)
-        
-        # Envoyer notification pour chaque utilisateur modifié
-        for user in self:
-            # Détecter si des champs importants ont changé
-            fields_to_monitor = ['name', 'email', 'lang', 'tz', 'active', 'notification_type', 'signature']
-            important_change = any(field in vals for field in fields_to_monitor)
-            
-            # Vérifier aussi les changements du partenaire associé
-            if 'partner_id' in vals or (user.partner_id and any(field in vals for field in ['phone', 'mobile', 'street', 'city', 'country_id'])):
-                important_change = True
-            
-            # Envoyer la notification
-            user._send_user_auth_notification(event_type='updated')
-            
-            # Log si changement important
-            if important_change:
-                _logger.info(f"📝 Changement important détecté pour user {user.id}: {list(vals.keys())}")
-        
+
+        # Notifier uniquement les utilisateurs dont le payload a réellement changé
+        changed_users = self.filtered(lambda user: user._ws_field_values(fnames) != old_values[user.id])
+        self.env["ws.dispatcher"].plan(changed_users, '_send_user_auth_notification')
+
         return result
 
     @api.model_create_multi
@@ -194,10 +252,7 @@ class ResUsers(models.Model):
                     'display_name': info['display_name'],
                     'login': info['login'],
                 }
-                self.env["ws.notifier"].send(channel, payload)
-                _logger.info(
-                    f"✅ WebSocket User Auth émis (deleted): {channel} - user_id={info['id']}"
-                )
+                self.env["ws.dispatcher"].send(channel, payload)
             except Exception as e:
                 _logger.error(
                     f"❌ Erreur émission WebSocket User Auth (deleted) pour {info['id']}: {str(e)}"
@@ -206,6 +261,28 @@ class ResUsers(models.Model):
         return result
 
 
+class ResGroups(models.Model):
+    """Le nom complet des groupes est dans le profil en cache de ResUsers"""
+    _inherit = 'res.groups'
+
+    def write(self, vals):
+        result = super(ResGroups, self).write(vals)
+        if 'name' in vals or 'category_id' in vals:
+            self.env.registry.clear_cache()
+        return result
+
+
+class IrModuleCategory(models.Model):
+    """La catégorie fait partie du nom complet des groupes"""
+    _inherit = 'ir.module.category'
+
+    def write(self, vals):
+        result = super(IrModuleCategory, self).write(vals)
+        if 'name' in vals:
+            self.env.registry.clear_cache()
+        return result
+
+
 class ResPartner(models.Model):
     """
     Hérite res.partner pour capturer les changements de profil partenaire
@@ -216,24 +293,18 @@ class ResPartner(models.Model):
     def write(self, vals):
         """Override write pour notifier les changements de partenaire aux utilisateurs associés"""
         result = super(ResPartner, self).write(vals)
-        
-        # Trouver les utilisateurs associés à ces partenaires
-        users = self.env['res.users'].search([('partner_id', 'in', self.ids)])
-        
-        # Si des utilisateurs sont trouvés et que des champs importants ont changé
+
+        # Vérifier d'abord les champs: la plupart des écritures partenaire
+        # (clients, imports) ne concernent aucun champ exposé
+        if not any(field in vals for field in PARTNER_PAYLOAD_FIELDS):
+            return result
+
+        # Une seule recherche par lot (index sur res_users.partner_id); les
+        # notifications sont fusionnées par utilisateur en fin de transaction
+        users = self.sudo().user_ids
         if users:
-            important_fields = ['name', 'email', 'phone', 'mobile', 'street', 'street2', 
-                              'city', 'state_id', 'country_id', 'zip', 'function', 
-                              'title', 'is_company', 'image_1920']
-            
-            if any(field in vals for field in important_fields):
-                # Notifier chaque utilisateur associé
-                for user in users:
-                    user._send_user_auth_notification(event_type='updated')
-                    _logger.info(
-                        f"📝 Partner {self.id} modifié - Notification envoyée à user {user.id}"
-                    )
-        
+            self.env["ws.dispatcher"].plan(users, '_send_user_auth_notification')
+
         return result
 
 
@@ -251,46 +322,8 @@ class HrEmployee(models.Model):
         # Trouver les utilisateurs associés à ces employés
         users = self.mapped('user_id').filtered(lambda u: u.exists())
         
-        # Notifier chaque utilisateur associé
-        for user in users:
-            user._send_user_auth_notification(event_type='updated')
-            _logger.info(
-                f"📝 Employee {self.id} modifié - Notification envoyée à user {user.id}"
-            )
+        # Notifier chaque utilisateur associé (une fois par transaction)
+        self.env["ws.dispatcher"].plan(users, '_send_user_auth_notification')
         
         return result
 
-
-# Extension du modèle hr.expense.account pour notifier les changements de balance
-class HrExpenseAccountExtended(models.Model):
-    """
-    Étend hr.expense.account pour notifier les changements de balance
-    à l'utilisateur associé
-    """
-    _inherit = 'hr.expense.account'
-    
-    def write(self, vals):
-        """Override write pour notifier les changements de balance"""
-        # Sauvegarder les anciennes balances
-        old_balances = {account.id: account.balance if hasattr(account, 'balance') else 0.0 
-                       for account in self}
-        
-        result = super(HrExpenseAccountExtended, self).write(vals)
-        
-        # Vérifier si la balance a changé et notifier l'utilisateur
-        for account in self:
-            new_balance = account.balance if hasattr(account, 'balance') else 0.0
-            old_balance = old_balances.get(account.id, 0.0)
-            
-            # Si la balance a changé, notifier l'utilisateur
-            if new_balance != old_balance:
-                if account.employee_id and account.employee_id.user_id:
-                    user = account.employee_id.user_id
-                    user._send_user_auth_notification(event_type='updated')
-                    _logger.info(
-                        f"💰 Balance changée pour account {account.id}: "
-                        f"{old_balance} -> {new_balance} - "
-                        f"Notification envoyée à user {user.id}"
-                    )
-        
-        return result
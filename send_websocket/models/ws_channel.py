@@ -0,0 +1,172 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import AccessError, UserError
+import re
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Canaux privés: le dernier entier du nom est l'id de l'utilisateur destinataire
+PRIVATE_CHANNEL_RE = re.compile(r'^geo_lambert_\w+?_(\d+)$')
+
+
+class WsChannel(models.Model):
+    """
+    Préférences par canal WebSocket (encodage négocié par le client),
+    séquence des messages et registre de présence des abonnés
+    """
+    _name = 'ws.channel'
+    _description = 'WebSocket Channel'
+    _order = 'name'
+
+    name = fields.Char("Canal", required=True, index=True, readonly=True)
+    encoding = fields.Selection(
+        [
+            ('json', 'JSON (legacy)'),
+            ('compact', 'Compact'),
+        ],
+        string="Encodage",
+        required=True,
+        default='json',
+        help="Format du message émis sur ce canal. 'compact' internalise les "
+             "enregistrements répétés et compresse les gros messages."
+    )
+    subscriber_count = fields.Integer(
+        "Abonnés",
+        readonly=True,
+        help="Nombre de connexions abonnées à ce canal, tenu à jour par le serveur WebSocket."
+    )
+    presence_date = fields.Datetime("Dernière mise à jour de présence", readonly=True)
+    last_seq = fields.Integer(
+        "Dernière séquence",
+        readonly=True,
+        help="Numéro du dernier message émis sur ce canal: séquence contiguë, "
+             "attribuée dans l'ordre des commits."
+    )
+
+    _sql_constraints = [
+        ('unique_name', 'UNIQUE(name)', 'Un canal WebSocket doit être unique.'),
+    ]
+
+    @api.model
+    def _channel_owner(self, channel):
+        """Retourne l'id utilisateur d'un canal privé, False pour un canal public"""
+        match = PRIVATE_CHANNEL_RE.match(channel or '')
+        return int(match.group(1)) if match else False
+
+    @api.model
+    def _check_channel_access(self, channel, configure=False):
+        """
+        Un utilisateur n'accède qu'à ses propres canaux privés et aux canaux
+        publics. configure=True: les canaux publics, partagés par tous les
+        clients, ne sont configurables que par un administrateur.
+        """
+        if self.env.user.has_group('base.group_system'):
+            return
+        owner = self._channel_owner(channel)
+        if (owner and owner != self.env.uid) or (configure and not owner):
+            raise AccessError(_("Vous n'avez pas accès au canal %s.") % channel)
+
+    @api.model
+    def _get_channel(self, channel, create=False):
+        """Retourne l'enregistrement du canal (sudo), optionnellement créé"""
+        record = self.sudo().search([('name', '=', channel)], limit=1)
+        if not record and create:
+            record = self.sudo().create({'name': channel})
+        return record
+
+    @api.model
+    def _next_seq(self, channel):
+        """
+        Incrémente la séquence du canal (créé au besoin) et retourne
+        (id du canal, séquence). Appelé uniquement après le commit, sur le
+        curseur READ COMMITTED de ws.dispatcher._send_outbox: la ligne du
+        canal reste verrouillée jusqu'au commit de ce curseur, les séquences
+        sont donc contiguës et validées dans l'ordre.
+        """
+        self.env.cr.execute("""
+            INSERT INTO ws_channel (name, encoding, subscriber_count, last_seq,
+                                    create_uid, create_date, write_uid, write_date)
+            VALUES (%s, 'json', 0, 1, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+            ON CONFLICT (name) DO UPDATE SET last_seq = COALESCE(ws_channel.last_seq, 0) + 1
+            RETURNING id, last_seq
+        """, (channel, self.env.uid, self.env.uid))
+        channel_id, seq = self.env.cr.fetchone()
+        self.invalidate_model(['last_seq'])
+        return channel_id, seq
+
+    @api.model
+    def set_channel_encoding(self, channel, encoding='compact'):
+        """
+        Appelé par l'application mobile pour négocier l'encodage d'un canal.
+        Retourne l'encodage effectivement appliqué.
+        """
+        if encoding not in dict(self._fields['encoding'].selection):
+            raise UserError(_("Encodage WebSocket inconnu: %s") % encoding)
+        self._check_channel_access(channel, configure=True)
+        record = self._get_channel(channel, create=True)
+        record.encoding = encoding
+        return record.encoding
+
+    @api.model
+    def _is_presence_tracking_enabled(self):
+        param = self.env['ir.config_parameter'].sudo().get_param('send_websocket.presence_tracking')
+        return param in ('1', 'True', 'true')
+
+    @api.model
+    def _is_observed(self, channel, record=None):
+        """
+        Faux uniquement pour un canal privé sans abonné, lorsque le suivi de
+        présence est activé: ws.dispatcher n'y construit alors aucun payload.
+        Les canaux publics sont toujours considérés comme observés.
+        record: enregistrement du canal déjà lu par l'appelant
+        """
+        if not self._is_presence_tracking_enabled() or not self._channel_owner(channel):
+            return True
+        if record is None:
+            record = self._get_channel(channel)
+        return bool(record and record.subscriber_count > 0)
+
+    @api.model
+    def _check_presence_access(self):
+        """Seul le serveur WebSocket (utilisateur technique administrateur) tient la présence"""
+        if not self.env.user.has_group('base.group_system'):
+            raise AccessError(_("Seul le serveur WebSocket peut mettre à jour la présence des canaux."))
+
+    @api.model
+    def set_presence(self, channel, subscribed=True):
+        """
+        Appelé par le serveur WebSocket à chaque abonnement / désabonnement.
+        Lors d'un abonnement, un événement 'resync' {'last_seq'} est émis sur
+        le canal: les messages non construits pendant l'absence ne sont pas
+        dans le journal de rejeu, le client doit donc recharger ses données
+        et reprendre le rejeu à last_seq.
+        Retourne le nombre d'abonnés du canal.
+        """
+        self._check_presence_access()
+        record = self._get_channel(channel, create=True)
+        record.write({
+            'subscriber_count': max(0, record.subscriber_count + (1 if subscribed else -1)),
+            'presence_date': fields.Datetime.now(),
+        })
+        if subscribed:
+            self.env['ws.dispatcher'].send(channel, {'last_seq': record.last_seq}, event_type='resync')
+        return record.subscriber_count
+
+    @api.model
+    def sync_presence(self, channels):
+        """
+        Remplace tout le registre par la liste des canaux observés, ex: au
+        redémarrage du serveur WebSocket. channels: {canal: nombre d'abonnés}
+        """
+        self._check_presence_access()
+        now = fields.Datetime.now()
+        self.sudo().search([('subscriber_count', '>', 0), ('name', 'not in', list(channels))]).write({
+            'subscriber_count': 0,
+            'presence_date': now,
+        })
+        for channel, count in channels.items():
+            self._get_channel(channel, create=True).write({
+                'subscriber_count': max(0, int(count)),
+                'presence_date': now,
+            })
+        return True
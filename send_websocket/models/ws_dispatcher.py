@@ -0,0 +1,481 @@
+from odoo import models, api, SUPERUSER_ID
+from collections import defaultdict
+from contextlib import contextmanager
+import base64
+import functools
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Versions du format de message
+# 1: JSON imbriqué historique (inchangé, seul schema_version est ajouté)
+# 2: JSON compact avec table de références, compressé au-delà du seuil
+SCHEMA_VERSION_LEGACY = 1
+SCHEMA_VERSION_COMPACT = 2
+
+DEFAULT_COMPRESS_THRESHOLD = 4096
+
+# Compteurs en mémoire du worker: (famille, événement) -> [messages, octets,
+# ms construction, ms émission, échecs, supprimés]. Vidés dans ws.stats au
+# plus toutes les METRICS_FLUSH_INTERVAL secondes, et par le cron.
+METRICS_FLUSH_INTERVAL = 60
+_metrics = defaultdict(lambda: [0, 0, 0.0, 0.0, 0, 0])
+_metrics_lock = threading.Lock()
+_metrics_last_flush = time.monotonic()
+
+# Empreinte du dernier payload émis par (canal, modèle, id): un payload
+# identique (hors clés volatiles) émis avant expiration n'est pas renvoyé
+DEFAULT_DEDUP_TTL = 60
+DEDUP_MAX_ENTRIES = 10000
+VOLATILE_KEYS = frozenset({'write_date', 'seq', 'version'})
+_payload_hashes = {}
+_payload_hashes_lock = threading.Lock()
+
+CHANNEL_ID_SUFFIX_RE = re.compile(r'(_\d+)+$')
+
+
+def _json_dumps(value):
+    return json.dumps(value, default=str, separators=(',', ':'), ensure_ascii=False)
+
+
+def _channel_family(channel):
+    """geo_lambert_expense_account_12_5 -> geo_lambert_expense_account"""
+    return CHANNEL_ID_SUFFIX_RE.sub('', channel or '') or 'unknown'
+
+
+def _record_metrics(family, event_type, size=0, build_ms=0.0, send_ms=0.0, failed=False, suppressed=False):
+    with _metrics_lock:
+        counters = _metrics[(family, event_type or 'unknown')]
+        if suppressed:
+            counters[5] += 1
+        elif not failed:
+            counters[0] += 1
+            counters[1] += size
+        counters[2] += build_ms
+        counters[3] += send_ms
+        if failed:
+            counters[4] += 1
+
+
+def _strip_volatile(value):
+    if isinstance(value, list):
+        return [_strip_volatile(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _strip_volatile(item) for key, item in value.items() if key not in VOLATILE_KEYS}
+    return value
+
+
+def _payload_digest(channel, payload):
+    """
+    (clé, empreinte) d'un payload pour la suppression des doublons, clé étant
+    (canal, modèle, id). None pour un payload sans id ou une suppression.
+    """
+    record_id = payload.get('id')
+    if not record_id or payload.get('event_type') == 'deleted':
+        return None
+    key = (channel, payload.get('model'), record_id)
+    digest = hashlib.sha1(
+        json.dumps(_strip_volatile(payload), sort_keys=True, default=str).encode('utf-8')
+    ).digest()
+    return key, digest
+
+
+def _is_duplicate(key, digest, pending):
+    """
+    Vrai si le même payload (hors write_date, seq et version) a déjà été émis
+    sur le même canal pour le même enregistrement: dans la transaction en
+    cours (pending), ou par une transaction validée il y a moins de ttl secondes.
+    """
+    if pending.get(key) == digest:
+        return True
+    with _payload_hashes_lock:
+        previous = _payload_hashes.get(key)
+        return bool(previous and previous[0] == digest and previous[1] > time.monotonic())
+
+
+def _remember_hashes(pending, ttl):
+    """
+    Appelé après le commit: mémorise les empreintes émises par la transaction.
+    Une transaction annulée (rollback, nouvelle tentative) ne laisse donc
+    aucune empreinte qui supprimerait à tort son propre message rejoué.
+    """
+    now = time.monotonic()
+    with _payload_hashes_lock:
+        if len(_payload_hashes) + len(pending) >= DEDUP_MAX_ENTRIES:
+            for expired in [k for k, (_, expiry) in _payload_hashes.items() if expiry <= now]:
+                del _payload_hashes[expired]
+            if len(_payload_hashes) + len(pending) >= DEDUP_MAX_ENTRIES:
+                _payload_hashes.clear()
+        for key, digest in pending.items():
+            _payload_hashes[key] = (digest, now + ttl)
+
+
+def _flush_outbox(registry, uid, outbox):
+    """
+    Callback postcommit de ws.dispatcher._enqueue: transmet les messages de
+    la transaction sur un curseur dédié. Une erreur est journalisée, elle ne
+    remet pas en cause la transaction déjà validée.
+    """
+    if not outbox:
+        return
+    try:
+        with registry.cursor() as cr:
+            cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            api.Environment(cr, uid, {})['ws.dispatcher'].sudo()._send_outbox(list(outbox))
+    except Exception as e:
+        _logger.error(f"❌ WebSocket: échec de l'émission de {len(outbox)} message(s): {str(e)}", exc_info=True)
+    finally:
+        outbox.clear()
+
+
+def _intern(value, refs, index):
+    """
+    Remplace chaque dict "feuille" portant un 'id' (partenaire, devise,
+    catégorie, projet...) par {'$ref': n}, n étant sa position dans refs.
+    Les dicts identiques partagent la même référence.
+    """
+    if isinstance(value, list):
+        return [_intern(item, refs, index) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    value = {key: _intern(item, refs, index) for key, item in value.items()}
+    if 'id' in value and not any(isinstance(item, (dict, list)) for item in value.values()):
+        key = _json_dumps(sorted(value.items()))
+        ref = index.get(key)
+        if ref is None:
+            ref = index[key] = len(refs)
+            refs.append(value)
+        return {'$ref': ref}
+    return value
+
+
+def ws_silent(method):
+    """
+    Décorateur de méthode de modèle: exécute la méthode en mode silencieux
+    (contexte ws_silent). Les notifications sont remplacées par un
+    événement 'resync' par canal en fin de transaction.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return method(self.with_context(ws_silent=True), *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def ws_silent_mode(records):
+    """
+    Gestionnaire de contexte équivalent:
+        with ws_silent_mode(self) as silent_self:
+            silent_self.recalculer()
+    """
+    yield records.with_context(ws_silent=True)
+
+
+class WsDispatcher(models.AbstractModel):
+    """
+    Point d'émission unique des notifications WebSocket de send_websocket.
+    Encode le payload selon la préférence du canal; après le commit, le
+    numérote (seq, contigu par canal), l'inscrit dans le journal de rejeu
+    (résumé en 'resync' s'il est volumineux) et le transmet à ws.notifier.
+    """
+    _name = 'ws.dispatcher'
+    _description = 'WebSocket Dispatcher'
+
+    @api.model
+    def _get_compress_threshold(self):
+        param = self.env['ir.config_parameter'].sudo().get_param('send_websocket.compress_threshold')
+        try:
+            return int(param) if param else DEFAULT_COMPRESS_THRESHOLD
+        except ValueError:
+            return DEFAULT_COMPRESS_THRESHOLD
+
+    @api.model
+    def _get_dedup_ttl(self):
+        """Durée de vie des empreintes de payload, 0 désactive la suppression des doublons"""
+        param = self.env['ir.config_parameter'].sudo().get_param('send_websocket.dedup_ttl')
+        try:
+            return int(param) if param else DEFAULT_DEDUP_TTL
+        except ValueError:
+            return DEFAULT_DEDUP_TTL
+
+    @api.model
+    def _pending_hashes(self, ttl):
+        """
+        Empreintes émises par la transaction en cours, mémorisées pour tout
+        le worker seulement après le commit (voir _remember_hashes)
+        """
+        data = self.env.cr.postcommit.data
+        if 'ws.dispatcher.hashes' not in data:
+            data['ws.dispatcher.hashes'] = {}
+            self.env.cr.postcommit.add(functools.partial(_remember_hashes, data['ws.dispatcher.hashes'], ttl))
+        return data['ws.dispatcher.hashes']
+
+    @api.model
+    def _is_project_broadcast_enabled(self):
+        """
+        Diffusion historique de tous les projets sur geo_lambert_expenses.
+        Désactivée par défaut: les projets sont émis sur le canal privé de
+        chaque follower; à réactiver seulement pour d'anciens clients.
+        """
+        param = self.env['ir.config_parameter'].sudo().get_param('send_websocket.project_broadcast')
+        return param in ('1', 'True', 'true')
+
+    @api.model
+    def _encode_compact(self, payload):
+        """
+        Format compact (schema_version 2):
+        {'schema_version', 'encoding', 'event_type', 'refs', 'data'}
+        ou, au-delà du seuil, 'data' = base64(gzip(json({'refs', 'data'}))).
+        """
+        refs, index = [], {}
+        data = {key: _intern(value, refs, index) for key, value in payload.items()}
+        message = {
+            'schema_version': SCHEMA_VERSION_COMPACT,
+            'encoding': 'compact',
+            'event_type': payload.get('event_type'),
+            'refs': refs,
+            'data': data,
+        }
+
+        body = _json_dumps({'refs': refs, 'data': data}).encode('utf-8')
+        if len(body) > self._get_compress_threshold():
+            message.update({
+                'encoding': 'compact+gzip',
+                'refs': [],
+                'data': base64.b64encode(gzip.compress(body)).decode('ascii'),
+            })
+        return message
+
+    @api.model
+    def _encode_message(self, channel, payload, channel_record=None):
+        """Applique l'encodage négocié pour le canal"""
+        if channel_record is None:
+            channel_record = self.env['ws.channel']._get_channel(channel)
+        if channel_record and channel_record.encoding == 'compact':
+            return self._encode_compact(payload)
+        return dict(payload, schema_version=SCHEMA_VERSION_LEGACY)
+
+    @api.model
+    def _flush_metrics(self):
+        """
+        Écrit les compteurs du worker dans ws.stats via un curseur dédié,
+        pour ne jamais interférer avec la transaction en cours.
+        """
+        global _metrics_last_flush
+        with _metrics_lock:
+            snapshot = dict(_metrics)
+            _metrics.clear()
+            _metrics_last_flush = time.monotonic()
+        if not snapshot:
+            return
+
+        vals_list = [{
+            'family': family,
+            'event_type': event_type,
+            'message_count': counters[0],
+            'payload_bytes': counters[1],
+            'build_ms': counters[2],
+            'send_ms': counters[3],
+            'failure_count': counters[4],
+            'suppressed_count': counters[5],
+        } for (family, event_type), counters in snapshot.items()]
+        try:
+            with self.env.registry.cursor() as cr:
+                api.Environment(cr, SUPERUSER_ID, {})['ws.stats'].create(vals_list)
+        except Exception as e:
+            _logger.warning("WebSocket: échec de l'enregistrement des statistiques: %s", e)
+
+    @api.model
+    def _is_silent(self):
+        """Mode silencieux: contexte ws_silent, ou import de données (import_file)"""
+        return bool(self.env.context.get('ws_silent') or self.env.context.get('import_file'))
+
+    @api.model
+    def _defer(self, channel, subject=None):
+        """Mémorise un envoi ignoré en mode silencieux, résumé par _flush_silent"""
+        data = self.env.cr.precommit.data
+        if 'ws.dispatcher.silent' not in data:
+            data['ws.dispatcher.silent'] = {}
+            self.env.cr.precommit.add(self._flush_silent)
+        model_name, ids = subject if subject else (False, ())
+        data['ws.dispatcher.silent'].setdefault(channel, {}).setdefault(model_name, set()).update(ids)
+
+    @api.model
+    def _flush_silent(self):
+        """
+        Émet un seul événement 'resync' par canal (et par modèle) touché en
+        mode silencieux: {'model', 'ids'}, ids étant les caisses, projets...
+        concernés. Le client recharge ces enregistrements.
+        """
+        data = self.env.cr.precommit.data
+        dispatcher = self.with_context(ws_silent=False, import_file=False)
+        while data.get('ws.dispatcher.silent'):
+            deferred = data.pop('ws.dispatcher.silent')
+            for channel, subjects in deferred.items():
+                for model_name, ids in subjects.items():
+                    dispatcher.send(channel, {'model': model_name, 'ids': sorted(ids)}, event_type='resync')
+
+    @api.model
+    def plan(self, records, method, event_type='updated', **delta):
+        """
+        Programme records.method(event_type=..., **delta) pour la fin de la
+        transaction. Les demandes identiques sont fusionnées: chaque
+        enregistrement n'est notifié qu'une fois par (méthode, event_type),
+        quel que soit le nombre d'écritures qui l'ont touché. Les listes
+        d'ids passées en delta (ex: changed_month_ids) sont réunies.
+        """
+        if not records:
+            return
+        # Les demandes faites en mode silencieux sont exécutées dans ce mode
+        bucket = 'ws.dispatcher.plan.silent' if self._is_silent() else 'ws.dispatcher.plan'
+        data = self.env.cr.precommit.data
+        if bucket not in data:
+            data[bucket] = {}
+            self.env.cr.precommit.add(self._flush_plan)
+        pending = data[bucket].setdefault((records._name, method, event_type), {})
+        for record_id in records.ids:
+            record_delta = pending.setdefault(record_id, {})
+            for key, ids in delta.items():
+                record_delta.setdefault(key, set()).update(ids or ())
+
+    @api.model
+    def _flush_plan(self):
+        """Exécute les notifications programmées par plan()"""
+        bucket = 'ws.dispatcher.plan.silent' if self._is_silent() else 'ws.dispatcher.plan'
+        data = self.env.cr.precommit.data
+        while data.get(bucket):
+            plan = data.pop(bucket)
+            for (model_name, method, event_type), pending in plan.items():
+                # Un enregistrement créé dans la transaction n'a pas besoin
+                # d'une seconde notification 'updated'
+                if event_type == 'updated':
+                    created = plan.get((model_name, method, 'created'), {})
+                    pending = {record_id: record_delta for record_id, record_delta in pending.items()
+                               if record_id not in created}
+
+                records = self.env[model_name].browse(list(pending)).exists()
+                if not any(pending.values()):
+                    if records:
+                        getattr(records, method)(event_type=event_type)
+                    continue
+                for record in records:
+                    kwargs = {key: sorted(ids) for key, ids in pending[record.id].items()}
+                    getattr(record, method)(event_type=event_type, **kwargs)
+        self.env.flush_all()
+
+    @api.model
+    def send_tombstone(self, channel, model_name, record_id, parent_id=False):
+        """
+        Émet une suppression minimale: {'event_type': 'deleted', 'model',
+        'id', 'parent_id', 'version'}, sans charger les données liées.
+        version est un horodatage en millisecondes, croissant.
+        """
+        self.send(channel, {
+            'model': model_name,
+            'id': record_id,
+            'parent_id': parent_id or False,
+            'version': int(time.time() * 1000),
+        }, event_type='deleted')
+
+    @api.model
+    def send(self, channel, payload, event_type=None, subject=None):
+        """
+        Émet payload sur channel via ws.notifier.
+        payload peut être un dict ou une fonction sans argument qui le construit,
+        ce qui permet de mesurer le temps de construction et de ne rien
+        construire pour un canal privé sans abonné (voir ws.channel._is_observed).
+        subject: enregistrements concernés (caisse, projet...), repris dans
+        l'événement 'resync' lorsque l'envoi est différé en mode silencieux,
+        ou lorsque le message est trop gros pour le journal de rejeu.
+        """
+        if subject is not None:
+            subject = (subject._name, subject.ids)
+        elif isinstance(payload, dict) and payload.get('id'):
+            subject = (payload.get('model') or False, [payload['id']])
+        if self._is_silent():
+            self._defer(channel, subject)
+            return
+        channel_record = self.env['ws.channel']._get_channel(channel)
+        if not self.env['ws.channel']._is_observed(channel, channel_record):
+            _logger.debug("WebSocket ignoré (aucun abonné): %s", channel)
+            return
+        family = _channel_family(channel)
+        build_ms = 0.0
+        start = time.perf_counter()
+        try:
+            if callable(payload):
+                payload = payload()
+                build_ms = (time.perf_counter() - start) * 1000
+            if event_type:
+                payload['event_type'] = event_type
+            event_type = payload.get('event_type')
+
+            ttl = self._get_dedup_ttl()
+            fingerprint = _payload_digest(channel, payload) if ttl > 0 else None
+            pending = self._pending_hashes(ttl) if fingerprint else None
+            if fingerprint and _is_duplicate(*fingerprint, pending):
+                _record_metrics(family, event_type, build_ms=build_ms, suppressed=True)
+                _logger.debug("WebSocket supprimé (payload identique): %s event=%s", channel, event_type)
+                return
+
+            message = self._encode_message(channel, payload, channel_record)
+        except Exception:
+            _record_metrics(family, event_type, build_ms=build_ms,
+                            send_ms=(time.perf_counter() - start) * 1000 - build_ms, failed=True)
+            raise
+
+        if fingerprint:
+            pending[fingerprint[0]] = fingerprint[1]
+        self._enqueue(channel, message, subject, build_ms)
+
+    @api.model
+    def _enqueue(self, channel, message, subject, build_ms):
+        """
+        Met le message en attente: il est numéroté, journalisé et transmis
+        après le commit (voir _flush_outbox). Une transaction annulée
+        n'émet donc rien.
+        """
+        data = self.env.cr.postcommit.data
+        if 'ws.dispatcher.outbox' not in data:
+            data['ws.dispatcher.outbox'] = []
+            self.env.cr.postcommit.add(functools.partial(
+                _flush_outbox, self.env.registry, self.env.uid, data['ws.dispatcher.outbox'],
+            ))
+        data['ws.dispatcher.outbox'].append((channel, message, subject, build_ms))
+
+    @api.model
+    def _send_outbox(self, outbox):
+        """
+        Numérote, journalise et transmet les messages d'une transaction validée.
+        Appelé sur un curseur dédié en READ COMMITTED: l'incrément de
+        ws_channel.last_seq verrouille la ligne du canal jusqu'au commit de
+        ce curseur seulement, ce qui donne des séquences contiguës par canal,
+        attribuées dans l'ordre des commits.
+        """
+        for channel, message, subject, build_ms in outbox:
+            family = _channel_family(channel)
+            event_type = message.get('event_type')
+            send_start = time.perf_counter()
+            try:
+                channel_id, message['seq'] = self.env['ws.channel']._next_seq(channel)
+                self.env['ws.event']._log_message(channel_id, message['seq'], _json_dumps(message), subject)
+                self.env["ws.notifier"].send(channel, message)
+            except Exception:
+                _record_metrics(family, event_type, build_ms=build_ms,
+                                send_ms=(time.perf_counter() - send_start) * 1000, failed=True)
+                raise
+            send_ms = (time.perf_counter() - send_start) * 1000
+            size = len(_json_dumps(message).encode('utf-8'))
+            _record_metrics(family, event_type, size=size, build_ms=build_ms, send_ms=send_ms)
+            _logger.debug("WebSocket émis: %s event=%s bytes=%s build=%.1fms send=%.1fms",
+                          channel, event_type, size, build_ms, send_ms)
+
+        if time.monotonic() - _metrics_last_flush > METRICS_FLUSH_INTERVAL:
+            self._flush_metrics()
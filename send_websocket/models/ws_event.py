@@ -0,0 +1,112 @@
+from odoo import models, fields, api
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_REPLAY_LOG_SIZE = 200
+DEFAULT_REPLAY_LIMIT = 500
+# Au-delà de cette taille, le journal ne garde qu'un 'resync' minimal
+DEFAULT_REPLAY_MAX_BYTES = 8192
+
+
+class WsEvent(models.Model):
+    """
+    Journal de rejeu borné: les derniers messages émis sur chaque canal,
+    tels qu'envoyés (encodés, avec leur seq). Permet au client de rattraper
+    les messages manqués après une reconnexion.
+    """
+    _name = 'ws.event'
+    _description = 'WebSocket Replay Log'
+    _order = 'channel_id, seq'
+    _log_access = False
+
+    channel_id = fields.Many2one('ws.channel', "Canal", required=True, index=True, ondelete='cascade')
+    seq = fields.Integer("Séquence", required=True)
+    date = fields.Datetime("Date", required=True, default=fields.Datetime.now)
+    message = fields.Text("Message", required=True)
+
+    _sql_constraints = [
+        ('unique_channel_seq', 'UNIQUE(channel_id, seq)', 'Une séquence ne peut apparaître qu\'une fois par canal.'),
+    ]
+
+    @api.model
+    def _get_replay_log_size(self):
+        param = self.env['ir.config_parameter'].sudo().get_param('send_websocket.replay_log_size')
+        try:
+            return int(param) if param else DEFAULT_REPLAY_LOG_SIZE
+        except ValueError:
+            return DEFAULT_REPLAY_LOG_SIZE
+
+    @api.model
+    def _get_replay_max_bytes(self):
+        param = self.env['ir.config_parameter'].sudo().get_param('send_websocket.replay_max_bytes')
+        try:
+            return int(param) if param else DEFAULT_REPLAY_MAX_BYTES
+        except ValueError:
+            return DEFAULT_REPLAY_MAX_BYTES
+
+    @api.model
+    def _log_message(self, channel_id, seq, message, subject=None):
+        """
+        Enregistre un message émis (appelé par ws.dispatcher.send).
+        message: message encodé (JSON). Au-delà de replay_max_bytes (payload
+        complet d'un projet envoyé à chaque abonné...), seul un 'resync'
+        {'model', 'ids'} de subject est conservé: le client rejoue alors un
+        rechargement de ces enregistrements au lieu du message.
+        """
+        if len(message) > self._get_replay_max_bytes():
+            model_name, ids = subject or (False, [])
+            message = json.dumps({
+                'event_type': 'resync',
+                'model': model_name,
+                'ids': list(ids),
+                'seq': seq,
+            })
+        self.env.cr.execute("""
+            INSERT INTO ws_event (channel_id, seq, date, message)
+            VALUES (%s, %s, now() at time zone 'UTC', %s)
+        """, (channel_id, seq, message))
+
+    @api.model
+    def get_events_since(self, channel, seq, limit=DEFAULT_REPLAY_LIMIT):
+        """
+        Appelé par l'application mobile après une reconnexion.
+        Retourne les messages de channel dont la séquence est > seq:
+        {'channel', 'last_seq', 'complete', 'events'}
+        Les séquences d'un canal sont contiguës et validées dans l'ordre:
+        un trou est toujours un message perdu.
+        complete=False signifie que des messages sont sortis du journal (ou
+        que limit est atteint): le client doit alors recharger ses données.
+        """
+        channel_model = self.env['ws.channel']
+        channel_model._check_channel_access(channel)
+        channel_record = channel_model._get_channel(channel)
+        if not channel_record:
+            return {'channel': channel, 'last_seq': 0, 'complete': True, 'events': []}
+
+        seq = int(seq or 0)
+        last_seq = channel_record.last_seq
+        events = self.sudo().search_fetch(
+            [('channel_id', '=', channel_record.id), ('seq', '>', seq)],
+            ['seq', 'message'], limit=limit,
+        )
+        complete = seq <= last_seq and len(events) == last_seq - seq
+        return {
+            'channel': channel,
+            'last_seq': last_seq,
+            'complete': complete,
+            'events': [json.loads(event.message) for event in events],
+        }
+
+    @api.model
+    def _cron_prune_replay_log(self):
+        """Ne conserve que les N derniers messages de chaque canal"""
+        self.env.cr.execute("""
+            DELETE FROM ws_event e
+             USING ws_channel c
+             WHERE e.channel_id = c.id
+               AND e.seq <= c.last_seq - %s
+        """, (self._get_replay_log_size(),))
+        _logger.info(f"WebSocket: {self.env.cr.rowcount} message(s) purgé(s) du journal de rejeu")
+        return True
@@ -0,0 +1,380 @@
+from odoo import models, api, tools
+import logging
+
+_logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Valeur d'une clé vide, par format
+EMPTY_VALUES = {
+    'value': False,
+    'date': False,
+    'id': False,
+    'pair': [],
+    'list': [],
+    'dict': None,
+    'many': [],
+}
+
+
+class Field:
+    """
+    Déclaration d'une clé de payload.
+
+    key: clé dans le payload
+    names: nom(s) de champ candidats, le premier qui existe sur le modèle est
+        retenu à la compilation; un chemin pointé ('partner_id.email') est accepté
+    fmt: 'value' (valeur brute), 'date' (isoformat), 'id' (id du many2one),
+        'pair' ([id, name]), 'list' ([{...}]), 'dict' ({...}) ou 'many' (x2many)
+    schema: sous-schéma des formats 'list', 'dict' et 'many'
+    default: valeur lorsque le champ n'existe pas ou que sa valeur est vide
+    omit: la clé est absente du payload lorsque la valeur est vide
+    order: ordre des enregistrements d'un 'many'
+    """
+    __slots__ = ('key', 'names', 'fmt', 'schema', 'default', 'omit', 'order')
+
+    def __init__(self, key, names=None, fmt='value', schema=None, default=_MISSING, omit=False, order=None):
+        self.key = key
+        self.names = (names,) if isinstance(names, str) else tuple(names or (key,))
+        self.fmt = fmt
+        self.schema = schema
+        self.default = default
+        self.omit = omit
+        self.order = order
+
+
+# Schémas des payloads WebSocket: nom -> (modèle racine, clés).
+# Un modèle racine None désigne un sous-schéma générique (compilé pour le
+# comodèle qui l'utilise).
+SCHEMAS = {
+    'ref': (None, [
+        Field('id'),
+        Field('name'),
+        Field('display_name'),
+    ]),
+    'currency': (None, [
+        Field('id'),
+        Field('display_name'),
+        Field('name'),
+        Field('symbol'),
+    ]),
+    'project': ('project.project', [
+        Field('id'),
+        Field('name'),
+        Field('project_type'),
+        Field('partner_id', fmt='id'),
+        Field('date_start', fmt='date'),
+        Field('date', fmt='date'),
+        Field('tasks', ('tasks', 'task_ids'), fmt='many', schema='task'),
+        Field('numero'),
+        # Format ARRAY comme l'API pour compatibilité avec le filtrage TypeScript
+        Field('message_follower_ids', fmt='many', schema='follower'),
+        Field('privacy_visibility'),
+        Field('create_date', fmt='date'),
+        Field('write_date', fmt='date'),
+        Field('project_source'),
+        Field('category_id', ('project_category_id', 'category_id', 'categ_id'), fmt='id'),
+        Field('type_ids', fmt='many', schema='ref'),
+    ]),
+    # Synchronisation incrémentale (mobile.sync): sans les listes imbriquées,
+    # synchronisées par leur propre modèle
+    'sync_project': ('project.project', [
+        Field('id'),
+        Field('name'),
+        Field('project_type'),
+        Field('partner_id', fmt='id'),
+        Field('date_start', fmt='date'),
+        Field('date', fmt='date'),
+        Field('numero'),
+        Field('message_follower_ids', fmt='many', schema='follower'),
+        Field('privacy_visibility'),
+        Field('create_date', fmt='date'),
+        Field('write_date', fmt='date'),
+        Field('project_source'),
+        Field('category_id', ('project_category_id', 'category_id', 'categ_id'), fmt='id'),
+        Field('type_ids', fmt='many', schema='ref'),
+    ]),
+    'sync_task': ('project.task', [
+        Field('id'),
+        Field('project_id', fmt='id'),
+        Field('timer_start', fmt='date'),
+        Field('timer_pause', fmt='date'),
+        Field('user_ids', fmt='many', schema='ref'),
+        Field('display_name'),
+        Field('name'),
+        Field('partner_id', fmt='id'),
+        Field('state'),
+        Field('write_date', fmt='date'),
+    ]),
+    # Carte de projet du fil mobile (get_mobile_project_feed): les totaux
+    # sont ajoutés par agrégation SQL
+    'project_card': ('project.project', [
+        Field('id'),
+        Field('name'),
+        Field('numero'),
+        Field('project_type'),
+        Field('partner_id', fmt='pair'),
+        Field('date_start', fmt='date'),
+        Field('date', fmt='date'),
+        Field('privacy_visibility'),
+        Field('project_source'),
+        Field('category_id', ('project_category_id', 'category_id', 'categ_id'), fmt='id'),
+        Field('write_date', fmt='date'),
+    ]),
+    'follower': ('mail.followers', [
+        Field('id'),
+        Field('partner_id', fmt='list', schema='ref'),
+        Field('partner_name', 'partner_id.name'),
+        Field('partner_email', 'partner_id.email'),
+    ]),
+    'task': ('project.task', [
+        Field('id'),
+        Field('timer_start', fmt='date'),
+        Field('timer_pause', fmt='date'),
+        Field('user_ids', fmt='many', schema='ref'),
+        Field('timesheet_ids', fmt='many', schema='task_timesheet', order='date desc, id desc'),
+        Field('expense_ids', fmt='many', schema='task_expense', order='date desc, id desc'),
+        Field('display_name'),
+        Field('name'),
+        Field('partner_id', fmt='id'),
+        Field('state'),
+    ]),
+    'task_timer': ('project.task', [
+        Field('id'),
+        Field('task_id', 'id'),
+        Field('timer_start', fmt='date'),
+        Field('timer_pause', fmt='date'),
+        Field('is_timer_running'),
+        Field('effective_hours', default=0.0),
+    ]),
+    'task_timesheet': ('account.analytic.line', [
+        Field('id'),
+        Field('name', default='Timesheet'),
+        Field('date', fmt='date'),
+        Field('unit_amount', default=0.0),
+        Field('amount', default=0.0),
+        Field('employee_id', fmt='pair'),
+        Field('project_id', fmt='pair'),
+        Field('task_id', fmt='pair'),
+    ]),
+    'task_expense': ('hr.expense.account.move', [
+        Field('id'),
+        Field('name', default='Dépense'),
+        Field('designation', default=''),
+        Field('date', fmt='date'),
+        Field('total_amount', default=0.0),
+        # solde_amount, balance et amount retombent sur total_amount pour le calcul TypeScript
+        Field('solde_amount', ('solde_amount', 'total_amount'), default=0.0),
+        Field('balance', ('balance', 'total_amount'), default=0.0),
+        Field('amount', ('amount', 'total_amount'), default=0.0),
+        Field('expense_move_type', default='spent'),
+        Field('expense_category_id', fmt='dict', schema='ref'),
+        Field('expense_type_id', fmt='dict', schema='ref'),
+        Field('employee_id', fmt='dict', schema='ref'),
+        Field('expense_account_id', fmt='dict', schema='ref'),
+        Field('project_id', fmt='dict', schema='ref'),
+        Field('task_id', fmt='dict', schema='ref'),
+        Field('currency_id', fmt='dict', schema='currency'),
+    ]),
+    'cashbox_move': ('hr.expense.account.move', [
+        Field('id'),
+        Field('name', default=''),
+        Field('display_name', default=''),
+        Field('solde_amount', default=0.0),
+        Field('balance', default=0.0),
+        Field('expense_move_type', default='spent'),
+        Field('date', fmt='date'),
+        Field('description', default=False),
+        Field('create_date', fmt='date'),
+        Field('write_date', fmt='date'),
+        Field('user_id', fmt='pair', omit=True),
+        Field('task_id', fmt='list', schema='ref'),
+    ]),
+    'month_transaction': ('hr.expense.account.move', [
+        Field('id'),
+        Field('name', default=''),
+        Field('display_name', default=''),
+        Field('balance', default=0.0),
+        Field('solde_amount', default=0.0),
+        Field('expense_move_type', default='spent'),
+        Field('date', fmt='date'),
+        Field('description'),
+        Field('create_date', fmt='date'),
+        Field('write_date', fmt='date'),
+        Field('user_id', fmt='pair', omit=True),
+        Field('expense_type_id', fmt='pair', omit=True),
+        Field('expense_category_id', fmt='pair', omit=True),
+        Field('project_id', fmt='pair', omit=True),
+        Field('task_id', fmt='pair', omit=True),
+        Field('currency_id', fmt='pair', omit=True),
+    ]),
+    'month': ('hr.expense.account.month', [
+        Field('id'),
+        Field('name', default=''),
+        Field('display_name', default=''),
+        Field('caisse_id', fmt='pair', default=False),
+        Field('sold', default=0.0),
+        Field('solde_initial', default=0.0),
+        Field('solde_final', default=0.0),
+        Field('transaction_ids', fmt='many', schema='month_transaction'),
+        Field('create_date', fmt='date'),
+        Field('write_date', fmt='date'),
+    ]),
+}
+
+
+def _resolve_path(model, names):
+    """Retourne (chemin, champ final) du premier candidat existant, sinon None"""
+    for name in names:
+        steps = name.split('.')
+        current, field = model, None
+        for step in steps:
+            field = current._fields.get(step) if current is not None else None
+            if field is None:
+                break
+            current = current.env[field.comodel_name] if field.relational else None
+        else:
+            return steps, field
+    return None
+
+
+def _getter(steps):
+    if len(steps) == 1:
+        step = steps[0]
+        return lambda record: record[step]
+
+    def get(record):
+        value = record
+        for step in steps:
+            value = value[step]
+        return value
+    return get
+
+
+def _scalar_column(spec, get):
+    """Colonne d'un format sans sous-schéma: records -> liste de valeurs"""
+    default = spec.default
+    fmt = spec.fmt
+    if fmt == 'date':
+        convert = lambda value: value.isoformat() if value else False
+    elif fmt == 'id':
+        convert = lambda value: value.id if value else False
+    elif fmt == 'pair':
+        convert = lambda value: [value.id, value.name] if value else []
+    else:
+        convert = lambda value: value
+
+    if default is _MISSING:
+        return lambda records: [convert(get(record)) for record in records]
+
+    def column(records):
+        values = []
+        for record in records:
+            value = convert(get(record))
+            values.append(value if value else default)
+        return values
+    return column
+
+
+def _relational_column(spec, get, path, extractor):
+    """
+    Colonne d'un format à sous-schéma. Les enregistrements liés de tout le
+    lot sont extraits en une fois, puis répartis par enregistrement.
+    """
+    path = '.'.join(path)
+    fmt = spec.fmt
+    empty = spec.default if spec.default is not _MISSING else EMPTY_VALUES[fmt]
+
+    def column(records):
+        related = records.mapped(path)
+        if related and not related.env.su:
+            # Payload construit avec les droits du destinataire: les
+            # enregistrements liés qu'il ne peut pas lire sont omis
+            related = related._filtered_access('read')
+        if fmt == 'many' and spec.order and related:
+            related = related.search([('id', 'in', related.ids)], order=spec.order)
+        by_id = dict(zip(related.ids, extractor(related)))
+        rank = {related_id: index for index, related_id in enumerate(by_id)} if spec.order else None
+
+        values = []
+        for record in records:
+            value = get(record)
+            if fmt == 'many':
+                ids = [related_id for related_id in value.ids if related_id in by_id]
+                if rank is not None:
+                    ids.sort(key=rank.get)
+                values.append([by_id[related_id] for related_id in ids] or empty)
+            elif value and value.id in by_id:
+                item = by_id[value.id]
+                values.append([item] if fmt == 'list' else item)
+            else:
+                values.append(empty)
+        return values
+    return column
+
+
+def _constant_column(value):
+    return lambda records: [value] * len(records)
+
+
+class WsSchema(models.AbstractModel):
+    """
+    Sérialisation déclarative des payloads WebSocket (voir SCHEMAS).
+    Chaque schéma est résolu une fois contre les champs réels du modèle puis
+    compilé en extracteur; les builders n'inspectent plus les modèles à
+    chaque émission.
+    """
+    _name = 'ws.schema'
+    _description = 'WebSocket Payload Schemas'
+
+    def _register_hook(self):
+        super(WsSchema, self)._register_hook()
+        # Compilation au chargement du registre: les erreurs de déclaration
+        # apparaissent au démarrage plutôt qu'à la première émission
+        for schema_name, (model_name, specs) in SCHEMAS.items():
+            if model_name and model_name in self.env:
+                self._get_extractor(schema_name, model_name)
+
+    @api.model
+    @tools.ormcache('schema_name', 'model_name')
+    def _get_extractor(self, schema_name, model_name):
+        """Compile le schéma pour le modèle: fonction records -> liste de dicts"""
+        model = self.env[model_name]
+        columns = []
+        for spec in SCHEMAS[schema_name][1]:
+            resolved = _resolve_path(model, spec.names)
+            if resolved is None:
+                _logger.debug("WebSocket schéma %s (%s): aucun champ parmi %s",
+                              schema_name, model_name, spec.names)
+                if not spec.omit:
+                    empty = spec.default if spec.default is not _MISSING else EMPTY_VALUES[spec.fmt]
+                    columns.append((spec.key, _constant_column(empty), False))
+                continue
+
+            path, field = resolved
+            get = _getter(path)
+            if spec.schema:
+                extractor = self._get_extractor(spec.schema, field.comodel_name)
+                column = _relational_column(spec, get, path, extractor)
+            else:
+                column = _scalar_column(spec, get)
+            columns.append((spec.key, column, spec.omit))
+
+        def extract(records):
+            computed = [(key, column(records), omit) for key, column, omit in columns]
+            rows = []
+            for index in range(len(records)):
+                row = {}
+                for key, values, omit in computed:
+                    value = values[index]
+                    if omit and not value:
+                        continue
+                    row[key] = value
+                rows.append(row)
+            return rows
+        return extract
+
+    @api.model
+    def serialize(self, schema_name, records):
+        """Payloads de records selon le schéma, dans l'ordre de records"""
+        return self._get_extractor(schema_name, records._name)(records)
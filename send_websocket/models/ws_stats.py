@@ -0,0 +1,43 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 30
+
+
+class WsStats(models.Model):
+    """
+    Compteurs d'émission WebSocket, vidés périodiquement depuis la mémoire
+    de chaque worker (voir ws.dispatcher). Une ligne par (worker, période,
+    famille de canal, type d'événement): l'agrégation se fait dans les vues.
+    """
+    _name = 'ws.stats'
+    _description = 'WebSocket Statistics'
+    _order = 'date desc, id desc'
+    _log_access = False
+
+    date = fields.Datetime("Date", required=True, index=True, default=fields.Datetime.now)
+    family = fields.Char("Famille de canal", required=True, index=True)
+    event_type = fields.Char("Événement")
+    message_count = fields.Integer("Messages", aggregator='sum')
+    payload_bytes = fields.Integer("Octets", aggregator='sum')
+    build_ms = fields.Float("Construction (ms)", aggregator='sum')
+    send_ms = fields.Float("Émission (ms)", aggregator='sum')
+    failure_count = fields.Integer("Échecs", aggregator='sum')
+    suppressed_count = fields.Integer("Supprimés (identiques)", aggregator='sum')
+
+    @api.model
+    def _cron_flush_metrics(self):
+        """Vide les compteurs du worker courant et purge les anciennes lignes"""
+        self.env['ws.dispatcher']._flush_metrics()
+
+        param = self.env['ir.config_parameter'].sudo().get_param('send_websocket.stats_retention_days')
+        try:
+            retention = int(param) if param else DEFAULT_RETENTION_DAYS
+        except ValueError:
+            retention = DEFAULT_RETENTION_DAYS
+        limit_date = fields.Datetime.now() - timedelta(days=retention)
+        self.sudo().search([('date', '<', limit_date)]).unlink()
+        return True
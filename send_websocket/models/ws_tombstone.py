@@ -0,0 +1,83 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 90
+# Durée maximale supposée d'une transaction qui supprime des enregistrements:
+# au-delà, une suppression validée en retard peut échapper aux curseurs
+SAFETY_LAG_SECONDS = 300
+
+
+class WsTombstone(models.Model):
+    """
+    Trace des suppressions (projets, tâches, dépenses) pour la synchronisation
+    incrémentale: un client qui revient après une absence reçoit les ids
+    supprimés depuis son dernier curseur (voir mobile.sync).
+    """
+    _name = 'ws.tombstone'
+    _description = 'Deleted Records Log'
+    _order = 'id'
+    _log_access = False
+
+    model_name = fields.Char("Modèle", required=True, index=True)
+    res_id = fields.Integer("ID supprimé", required=True)
+    parent_id = fields.Integer("ID parent")
+    date = fields.Datetime("Date", required=True, index=True, default=fields.Datetime.now)
+
+    @api.model
+    def _get_retention_days(self):
+        param = self.env['ir.config_parameter'].sudo().get_param('send_websocket.tombstone_retention_days')
+        try:
+            return int(param) if param else DEFAULT_RETENTION_DAYS
+        except ValueError:
+            return DEFAULT_RETENTION_DAYS
+
+    @api.model
+    def _record(self, model_name, parent_by_id):
+        """Appelé par les surcharges unlink: parent_by_id = {id supprimé: id parent}"""
+        if not parent_by_id:
+            return self
+        return self.sudo().create([{
+            'model_name': model_name,
+            'res_id': res_id,
+            'parent_id': parent_id or 0,
+        } for res_id, parent_id in parent_by_id.items()])
+
+    @api.model
+    def _get_purged_id(self):
+        """Plus grand id de suppression purgé: un curseur antérieur a perdu des suppressions"""
+        param = self.env['ir.config_parameter'].sudo().get_param('send_websocket.tombstone_purged_id')
+        try:
+            return int(param) if param else 0
+        except ValueError:
+            return 0
+
+    @api.model
+    def _get_last_id(self):
+        return self.sudo().search([], order='id desc', limit=1).id or 0
+
+    @api.model
+    def _get_stable_id(self):
+        """
+        Plus grand id jusqu'où un curseur peut avancer sans perdre de suppression.
+        Les ids sont attribués à l'insertion mais visibles au commit: une
+        transaction plus lente peut encore valider un id inférieur au dernier
+        id lu. On s'arrête donc avant la première suppression de moins de
+        SAFETY_LAG_SECONDS.
+        """
+        limit_date = fields.Datetime.now() - timedelta(seconds=SAFETY_LAG_SECONDS)
+        recent = self.sudo().search([('date', '>=', limit_date)], order='id asc', limit=1)
+        return recent.id - 1 if recent else self._get_last_id()
+
+    @api.model
+    def _cron_purge(self):
+        """Purge les suppressions plus anciennes que la rétention, et note le plus grand id purgé"""
+        limit_date = fields.Datetime.now() - timedelta(days=self._get_retention_days())
+        tombstones = self.sudo().search([('date', '<', limit_date)])
+        if tombstones:
+            purged_id = max(max(tombstones.ids), self._get_purged_id())
+            self.env['ir.config_parameter'].sudo().set_param('send_websocket.tombstone_purged_id', purged_id)
+            tombstones.unlink()
+        return True